@@ -6,12 +6,32 @@ import time
 import uuid
 import hashlib
 import io
+import mmap
+import re
 import os  # ضروري جداً لتحديد المسارات
-from datetime import datetime, timedelta
+import random
+import threading
+import functools
+from contextlib import contextmanager
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from datetime import datetime, timedelta, timezone
 from google.oauth2.service_account import Credentials
+from google.auth.transport.requests import AuthorizedSession, Request as AuthRequest
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
+import requests
+from requests.adapters import HTTPAdapter
 from googleapiclient.discovery import build
-from googleapiclient.http import MediaIoBaseUpload, MediaIoBaseDownload
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest, MediaIoBaseUpload, MediaIoBaseDownload
 from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.http_client import HTTPClient
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
 
 # ==========================================
 # 0. تحديد المسار الأساسي (FIX)
@@ -92,191 +112,2052 @@ def _get_creds_object():
     st.error("⚠️ لم يتم العثور على إعدادات الاتصال (secrets or service_account.json)")
     return None
 
-@st.cache_resource(ttl=600)
+# --- القياسات (Instrumentation) ---
+# زمن كل عملية (مدرج تكراري بحدود ثابتة، ذاكرة ثابتة مهما كثرت الطلبات)،
+# وعدد طلبات Sheets/Drive والبايتات وإعادة المحاولة و429، وعدد الطلبات لكل تشغيل صفحة
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+RERUN_HISTORY = 200
+
+class _Histogram:
+    __slots__ = ("counts", "count", "total", "max")
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count, self.total, self.max = 0, 0.0, 0.0
+
+    def observe(self, ms):
+        i = 0
+        while i < len(LATENCY_BUCKETS_MS) and ms > LATENCY_BUCKETS_MS[i]: i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+
+    def percentile(self, q):
+        """الحد الأعلى للفئة التي تقع فيها النسبة المئوية q (تقريبي)"""
+        if not self.count: return 0.0
+        target, seen = q * self.count, 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= target:
+                return min(self.max, LATENCY_BUCKETS_MS[i]) if i < len(LATENCY_BUCKETS_MS) else self.max
+        return self.max
+
+class _Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ops = {}       # (النوع، الاسم، التصنيف) -> {"hist", "errors", "bytes"}
+        self.counters = {}  # (العداد، التصنيف) -> عدد
+        self.reruns = deque(maxlen=RERUN_HISTORY)
+        self.active_runs = OrderedDict()  # الجلسة -> التشغيل الجاري
+        self.started = time.time()
+
+    def observe(self, kind, name, label, seconds, nbytes=0, error=False):
+        with self.lock:
+            op = self.ops.get((kind, name, label))
+            if op is None: op = self.ops[(kind, name, label)] = {"hist": _Histogram(), "errors": 0, "bytes": 0}
+            op["hist"].observe(seconds * 1000)
+            op["bytes"] += nbytes
+            if error: op["errors"] += 1
+        run = getattr(_metrics_local, "run", None)
+        if run is not None:
+            run["last"] = time.perf_counter()
+            if kind == "api":
+                run["calls"] += 1
+                run["bytes"] += nbytes
+
+    def incr(self, counter, label="", n=1):
+        with self.lock:
+            self.counters[(counter, label)] = self.counters.get((counter, label), 0) + n
+
+_metrics_local = threading.local()
+
+@st.cache_resource
+def _get_metrics():
+    return _Metrics()
+
+def _record_api(service, seconds, nbytes=0, status=200):
+    m = _get_metrics()
+    m.observe("api", service, "", seconds, nbytes, error=status >= 400)
+    if status == 429: m.incr("429", service)
+
+def _is_failure(result):
+    # دوال الكتابة ترجع False عند الفشل، ودوال القراءة None أو (None, ...)
+    return result is None or result is False or (isinstance(result, tuple) and bool(result) and result[0] is None)
+
+def _timed(op, label_arg=None):
+    """قياس زمن عملية عامة؛ label_arg رقم المعامل الذي يُصنَّف به (مثل اسم الجدول)"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            label = str(args[label_arg]) if label_arg is not None and len(args) > label_arg else ""
+            start = time.perf_counter()
+            failed = True
+            try:
+                result = func(*args, **kwargs)
+                failed = _is_failure(result)
+                return result
+            finally:
+                _get_metrics().observe("op", op, label, time.perf_counter() - start, error=failed)
+        return wrapper
+    return decorator
+
+def track_rerun(page):
+    """تُستدعى أعلى كل صفحة: تغلق قياس التشغيل السابق لنفس الجلسة وتبدأ قياساً جديداً.
+    زمن التشغيل المسجل = من بداية الصفحة حتى انتهاء آخر عملية backend فيها"""
+    m = _get_metrics()
+    session = _current_session_id()
+    now = time.perf_counter()
+    run = {"page": page, "at": datetime.now().strftime("%H:%M:%S"), "start": now, "last": now, "calls": 0, "bytes": 0}
+    with m.lock:
+        previous = m.active_runs.pop(session, None)
+        m.active_runs[session] = run
+        while len(m.active_runs) > RERUN_HISTORY: m.active_runs.popitem(last=False)
+        if previous is not None:
+            m.reruns.append({
+                "page": previous["page"], "at": previous["at"], "calls": previous["calls"], "bytes": previous["bytes"],
+                "backend_ms": round((previous["last"] - previous["start"]) * 1000, 1),
+            })
+    # كل تشغيل في Streamlit له خيط خاص، فالعدّ داخل التشغيل يمر عبر متغير الخيط
+    _metrics_local.run = run
+
+def get_metrics():
+    """لقطة من القياسات لعرضها في لوحة الإدارة"""
+    m = _get_metrics()
+    with m.lock:
+        ops = [{
+            "type": kind, "name": name, "label": label, "count": op["hist"].count, "errors": op["errors"],
+            "p50_ms": op["hist"].percentile(0.5), "p90_ms": op["hist"].percentile(0.9),
+            "p99_ms": op["hist"].percentile(0.99), "max_ms": round(op["hist"].max, 1),
+            "total_s": round(op["hist"].total / 1000, 2), "bytes": op["bytes"],
+        } for (kind, name, label), op in m.ops.items()]
+        counters = [{"counter": c, "label": l, "value": v} for (c, l), v in m.counters.items()]
+        reruns = list(m.reruns)
+    return {"operations": ops, "counters": counters, "reruns": reruns, "since": m.started}
+
+def reset_metrics():
+    m = _get_metrics()
+    with m.lock:
+        m.ops, m.counters, m.started = {}, {}, time.time()
+        m.reruns.clear()
+
+# --- محدد معدل الطلبات (Rate Limiter) ---
+# دلاء توكنات مشتركة لكل العملية بحدود حصص Sheets (قراءة/كتابة في الدقيقة) وDrive،
+# فتبقى كل الجلسات تحت الحصة بدلاً من الاصطدام بخطأ 429 والانتظار الطويل معاً.
+# الأعمال الخلفية (الكتابة المؤجلة، الضغط) لا تستهلك الجزء المحجوز للطلبات التفاعلية
+
+RATE_LIMITS = {"sheets_read": 60, "sheets_write": 60, "drive": 1000}  # طلب/دقيقة
+RATE_BURST = 0.25        # نسبة الحصة المسموحة دفعة واحدة (الباقي يُعبأ بانتظام)
+RATE_RESERVE = 0.5       # نسبة الدفعة المحجوزة للطلبات التفاعلية
+
+class _TokenBucket:
+    def __init__(self, per_minute):
+        # دفعة + تعبئة منتظمة = الحصة بالضبط خلال أي دقيقة
+        self.capacity = max(1.0, per_minute * RATE_BURST)
+        self.rate = per_minute * (1 - RATE_BURST) / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+        self.waits, self.waited = 0, 0.0
+
+    def acquire(self, background=False):
+        floor = self.capacity * RATE_RESERVE if background else 0.0
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens - floor >= 1:
+                    self.tokens -= 1
+                    if waited:
+                        self.waits += 1
+                        self.waited += waited
+                    return waited
+                delay = (floor + 1 - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def drain(self):
+        """بعد 429: نفرغ الدلو فتتباطأ كل الجلسات بانتظام بدلاً من التوقف معاً"""
+        with self.lock:
+            self.tokens = min(self.tokens, 0.0)
+            self.updated = time.monotonic()
+
+_rate_local = threading.local()
+
+@contextmanager
+def background_priority():
+    """تنفيذ الطلبات داخل هذا السياق كأعمال خلفية (أولوية أقل)"""
+    previous = getattr(_rate_local, "background", False)
+    _rate_local.background = True
+    try: yield
+    finally: _rate_local.background = previous
+
+@st.cache_resource
+def _get_rate_limiter():
+    try: conf = st.secrets.get("rate_limits", {})
+    except Exception: conf = {}
+    return {name: _TokenBucket(float(conf.get(f"{name}_per_minute", limit))) for name, limit in RATE_LIMITS.items()}
+
+def _rate_limit(bucket):
+    return _get_rate_limiter()[bucket].acquire(background=getattr(_rate_local, "background", False))
+
+def _rate_drain(bucket):
+    _get_rate_limiter()[bucket].drain()
+
+def get_rate_limit_stats():
+    return [{"bucket": name, "tokens": round(b.tokens, 1), "capacity": b.capacity,
+             "waits": b.waits, "waited": round(b.waited, 2)} for name, b in _get_rate_limiter().items()]
+
+class _RateLimitedHTTPClient(HTTPClient):
+    """كل طلب gspread يمر من دلو القراءة (GET) أو الكتابة"""
+    # العميل مشترك بين الخيوط، فمهلة الطلب تُحسب عند كل طلب بدل تعديلها على العميل
+    @property
+    def timeout(self): return _attempt_timeout(self._timeout)
+
+    @timeout.setter
+    def timeout(self, value): self._timeout = value
+
+    def request(self, method, endpoint, *args, **kwargs):
+        bucket = "sheets_read" if method.upper() in ("GET", "HEAD") else "sheets_write"
+        _rate_limit(bucket)
+        start = time.perf_counter()
+        try:
+            response = super().request(method, endpoint, *args, **kwargs)
+            _record_api(bucket, time.perf_counter() - start, len(response.content))
+            return response
+        except APIError as e:
+            _record_api(bucket, time.perf_counter() - start, len(e.response.content or b""), e.response.status_code)
+            if e.response.status_code == 429: _rate_drain(bucket)
+            raise
+
+class _RateLimitedHttp(AuthorizedHttp):
+    """كل طلب Drive (بما فيها أجزاء الرفع والتحميل) يمر من دلو Drive"""
+    def request(self, uri, method="GET", *args, **kwargs):
+        _rate_limit("drive")
+        self._set_timeout(_attempt_timeout(HTTP_TIMEOUT))
+        start = time.perf_counter()
+        resp, content = super().request(uri, method, *args, **kwargs)
+        headers = kwargs.get("headers") or (args[1] if len(args) > 1 else None) or {}
+        sent = int(headers.get("Content-Length") or headers.get("content-length") or 0)
+        _record_api("drive", time.perf_counter() - start, len(content or b"") + sent, resp.status)
+        if resp.status == 429 or (resp.status == 403 and b"rateLimitExceeded" in (content or b"")):
+            _rate_drain("drive")
+        return resp, content
+
+    def _set_timeout(self, timeout):
+        """httplib2 يثبت المهلة عند فتح الاتصال؛ الكائن خاص بالخيط فيُعدَّل هو واتصالاته المفتوحة"""
+        if self.http.timeout == timeout: return
+        self.http.timeout = timeout
+        for conn in self.http.connections.values():
+            conn.timeout = timeout
+            if conn.sock is not None: conn.sock.settimeout(timeout)
+
+# --- طبقة المصادقة والاتصال المشتركة (Shared Auth/Transport) ---
+# بيانات الاعتماد تُقرأ مرة واحدة للعملية، والتوكن يُجدَّد في الخلفية قبل انتهائه،
+# وجلسة HTTP واحدة (keep-alive) لـ gspread، وكائن Drive واحد لكل العملية
+
+TOKEN_REFRESH_MARGIN = 300
+HTTP_POOL_SIZE = 10
+HTTP_TIMEOUT = 60
+
+_call_local = threading.local()
+
+def _attempt_timeout(default):
+    """مهلة الطلب: لا تتجاوز ما بقي من مهلة _call_api الجارية في هذا الخيط"""
+    at = getattr(_call_local, "deadline_at", None)
+    if at is None: return default
+    remaining = max(1.0, at - time.monotonic())
+    return remaining if default is None else min(default, remaining)
+
+class _AuthTransport:
+    def __init__(self, creds):
+        self.creds = creds
+        self.lock = threading.Lock()
+        self.session = AuthorizedSession(creds)
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        self.session.mount("https://", adapter)
+        self._token_request = AuthRequest(requests.Session())
+        self._local = threading.local()
+        self._drive = None
+        self._gspread = None
+        threading.Thread(target=self._refresh_loop, daemon=True, name="token-refresh").start()
+
+    def refresh(self):
+        with self.lock: self.creds.refresh(self._token_request)
+
+    def _refresh_loop(self):
+        while True:
+            expiry = self.creds.expiry
+            now = datetime.now(timezone.utc).replace(tzinfo=None)
+            wait = (expiry - now).total_seconds() - TOKEN_REFRESH_MARGIN if expiry else 0
+            if wait > 0:
+                time.sleep(min(wait, 600))
+                continue
+            try: self.refresh()
+            except Exception as e:
+                print(f"Token refresh error: {e}")
+                time.sleep(30)
+
+    def _http(self):
+        """httplib2 غير آمن بين الخيوط: اتصال دائم (keep-alive) لكل خيط"""
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = self._local.http = _RateLimitedHttp(self.creds, http=httplib2.Http(timeout=HTTP_TIMEOUT))
+        return http
+
+    def _build_request(self, http, *args, **kwargs):
+        return HttpRequest(self._http(), *args, **kwargs)
+
+    def drive(self):
+        with self.lock:
+            if self._drive is None:
+                self._drive = build('drive', 'v3', http=self._http(), cache_discovery=False,
+                                    requestBuilder=self._build_request)
+            return self._drive
+
+    def gspread_client(self):
+        with self.lock:
+            if self._gspread is None:
+                self._gspread = gspread.Client(auth=self.creds, session=self.session, http_client=_RateLimitedHTTPClient)
+                self._gspread.set_timeout(HTTP_TIMEOUT)
+            return self._gspread
+
+@st.cache_resource
+def _get_auth_transport():
+    c = _get_creds_object()
+    return _AuthTransport(c) if c else None
+
+def _get_drive_service():
+    transport = _get_auth_transport()
+    return transport.drive() if transport else None
+
 def get_connection():
     """إنشاء اتصال مع Google Sheets"""
-    c = _get_creds_object()
-    return gspread.authorize(c) if c else None
+    transport = _get_auth_transport()
+    return transport.gspread_client() if transport else None
+
+# --- سياسة إعادة المحاولة وقاطع الدائرة (Retry Policy / Circuit Breaker) ---
+# الأخطاء المؤقتة (429، 5xx، انقطاع الشبكة) يُعاد تنفيذها بانتظار أُسّي عشوائي
+# ضمن مهلة كلية للطلب. عند تكرار الفشل يُفتح القاطع فتفشل الطلبات فوراً
+# (وتُعرض البيانات المحفوظة) حتى تمر فترة التهدئة وتنجح محاولة تجريبية
+
+class BackendError(Exception):
+    """خطأ في الوصول لخدمات Google"""
+    message = "تعذر الاتصال بخدمات Google"
+    def __init__(self, detail="", status=None):
+        super().__init__(detail or self.message)
+        self.status = status
+
+class NotFoundError(BackendError):
+    message = "العنصر غير موجود"
+
+class AccessDeniedError(BackendError):
+    message = "لا توجد صلاحية للوصول"
+
+class RequestError(BackendError):
+    message = "طلب غير صالح"
+
+class TransientError(BackendError):
+    message = "خدمات Google لا تستجيب حالياً، حاول لاحقاً"
+
+class QuotaError(TransientError):
+    message = "تم تجاوز حد الطلبات، حاول بعد قليل"
+
+class ServiceUnavailableError(TransientError):
+    message = "خدمات Google متوقفة مؤقتاً، يتم عرض آخر نسخة محفوظة"
+
+RETRY_POLICY = {"attempts": 5, "base_delay": 0.5, "max_delay": 8.0, "deadline": 20.0}
+CIRCUIT_FAILURE_THRESHOLD = 5
+CIRCUIT_COOLDOWN = 30
+_RETRYABLE_STATUSES = (408, 429, 500, 502, 503, 504)
+# أخطاء تعني أن الطلب لم يصل للسيرفر أصلاً، فإعادته آمنة حتى للكتابة غير المتكررة
+_NOT_SENT_ERRORS = (requests.exceptions.ConnectTimeout, ConnectionRefusedError, httplib2.ServerNotFoundError)
+
+def _retry_policy():
+    try: conf = st.secrets.get("retry", {})
+    except Exception: conf = {}
+    return {k: float(conf.get(k, v)) for k, v in RETRY_POLICY.items()}
+
+def _classify_error(e):
+    """تحويل أخطاء gspread/Drive/الشبكة إلى الأنواع أعلاه"""
+    if isinstance(e, BackendError): return e
+    if isinstance(e, WorksheetNotFound): return NotFoundError(str(e), 404)
+    status = None
+    if isinstance(e, APIError): status = e.response.status_code
+    elif isinstance(e, HttpError): status = e.resp.status
+    elif isinstance(e, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                        httplib2.HttpLib2Error, TimeoutError, ConnectionError, OSError)):
+        return TransientError(str(e))
+    else:
+        return None
+    text = str(e)
+    if status == 429 or (status == 403 and ("rateLimitExceeded" in text or "RESOURCE_EXHAUSTED" in text)):
+        return QuotaError(text, status)
+    if status in _RETRYABLE_STATUSES: return TransientError(text, status)
+    if status == 404: return NotFoundError(text, status)
+    if status in (401, 403): return AccessDeniedError(text, status)
+    return RequestError(text, status)
+
+class _CircuitBreaker:
+    def __init__(self, name):
+        self.name = name
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened_at = None
+        self.trial = None  # الخيط الذي ينفذ الطلب التجريبي
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None: return True
+            if time.time() - self.opened_at < CIRCUIT_COOLDOWN: return False
+            # بعد التهدئة: طلب تجريبي واحد فقط يختبر عودة الخدمة
+            if self.trial is not None: return False
+            self.trial = threading.get_ident()
+            return True
+
+    def success(self):
+        with self.lock: self.failures, self.opened_at, self.trial = 0, None, None
+
+    def failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial = None
+            if self.opened_at is not None or self.failures >= CIRCUIT_FAILURE_THRESHOLD:
+                if self.opened_at is None: print(f"Circuit '{self.name}' opened")
+                self.opened_at = time.time()
+
+    def release(self):
+        """الطلب التجريبي انتهى بدون نتيجة (خطأ غير متوقع): تُسمح محاولة تجريبية أخرى"""
+        with self.lock:
+            if self.trial == threading.get_ident(): self.trial = None
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened_at is None: return "closed"
+            return "half-open" if time.time() - self.opened_at >= CIRCUIT_COOLDOWN else "open"
+
+@st.cache_resource
+def _get_circuit_breakers():
+    return {"sheets": _CircuitBreaker("sheets"), "drive": _CircuitBreaker("drive")}
+
+def get_circuit_state(service="sheets"):
+    return _get_circuit_breakers()[service].state
+
+def _call_api(func, *args, service="sheets", deadline=None, retry_transient=True, **kwargs):
+    """تنفيذ طلب API مع إعادة المحاولة؛ يرفع أحد أخطاء BackendError عند الفشل
+    retry_transient=False للكتابة التي لا تُكرر بأمان (إضافة/حذف صف): المهلة أو 5xx قد
+    تأتي بعد تنفيذها في السيرفر، فلا يُعاد إلا الطلب المرفوض (429) أو الذي لم يُرسل"""
+    # استدعاء متداخل (func نفسها تستدعي _call_api لنفس الخدمة) لا يأخذ الطلب التجريبي
+    # ولا يحرره: القاطع يخص الاستدعاء الخارجي فقط
+    active = getattr(_call_local, "services", None)
+    if active is None: active = _call_local.services = set()
+    breaker = None if service in active else _get_circuit_breakers()[service]
+    if breaker is not None and not breaker.allow():
+        _get_metrics().incr("circuit_rejections", service)
+        raise ServiceUnavailableError()
+    policy = _retry_policy()
+    outer_deadline = getattr(_call_local, "deadline_at", None)
+    deadline_at = time.monotonic() + (deadline or policy["deadline"])
+    if outer_deadline is not None: deadline_at = min(deadline_at, outer_deadline)
+    _call_local.deadline_at = deadline_at
+    active.add(service)
+    attempt = 0
+    try:
+        while True:
+            try:
+                result = func(*args, **kwargs)
+                if breaker is not None: breaker.success()
+                return result
+            except Exception as e:
+                error = _classify_error(e)
+                if error is None: raise
+                if not isinstance(error, TransientError):
+                    if breaker is not None: breaker.success()  # الخدمة تعمل، الخطأ في الطلب نفسه
+                    raise error from e
+                attempt += 1
+                safe = retry_transient or isinstance(error, QuotaError) or isinstance(e, _NOT_SENT_ERRORS)
+                # انتظار أُسّي بعشوائية كاملة (full jitter) حتى لا تعيد الجلسات المحاولة معاً
+                delay = random.uniform(0, min(policy["max_delay"], policy["base_delay"] * 2 ** attempt))
+                if not safe or attempt >= policy["attempts"] or time.monotonic() + delay > deadline_at:
+                    if breaker is not None: breaker.failure()
+                    _get_metrics().incr("failures", service)
+                    raise error from e
+                _get_metrics().incr("retries", service)
+                time.sleep(delay)
+    finally:
+        _call_local.deadline_at = outer_deadline
+        if breaker is not None:
+            active.discard(service)
+            # خطأ غير مصنف (أو مقاطعة) أثناء الطلب التجريبي لا يترك القاطع مغلقاً على الخدمة للأبد
+            breaker.release()
+
+_api_error_local = threading.local()
+
+def last_api_error():
+    """آخر خطأ API في هذا الخيط (لتمييز "غير موجود" عن "Google متوقف" بعد إرجاع None)"""
+    return getattr(_api_error_local, "error", None)
 
 def _execute_with_retry(func, *args, **kwargs):
-    """دالة مساعدة لإعادة المحاولة بذكاء عند حدوث أخطاء API"""
-    for i in range(5):
-        try: return func(*args, **kwargs)
-        except APIError as e:
-            if e.response.status_code == 429: 
-                wait_time = (2 ** i) + 1
-                time.sleep(wait_time)
-                continue
-            else: return None
-        except: return None
+    """دالة مساعدة لإعادة المحاولة بذكاء عند حدوث أخطاء API (تُرجع None عند الفشل)"""
+    _api_error_local.error = None
+    try: return _call_api(func, *args, **kwargs)
+    except BackendError as e:
+        _api_error_local.error = e
+        print(f"API error ({type(e).__name__}): {e}")
+    except Exception as e:
+        _api_error_local.error = BackendError(str(e))
+        print(f"Unexpected error in API call: {e!r}")
     return None
 
+# --- مخزن مقابض الشيت (Spreadsheet / Worksheet Handle Pool) ---
+# فتح الملف open_by_key وجلب الورقة worksheet() كل منهما طلب API إضافي،
+# لذلك نحتفظ بالمقابض على مستوى العملية ونحدّثها فقط عند الإنشاء أو إعادة التسمية
+
+class _HandlePool:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.client = None
+        self.spreadsheet = None
+        self.worksheets = {}
+
+    def reset(self, client=None):
+        self.client, self.spreadsheet, self.worksheets = client, None, {}
+
+@st.cache_resource
+def _get_handle_pool():
+    return _HandlePool()
+
+def _get_spreadsheet(client):
+    """مقبض الملف الرئيسي (يُفتح مرة واحدة لكل اتصال)"""
+    pool = _get_handle_pool()
+    with pool.lock:
+        if pool.client is not client: pool.reset(client)
+        if pool.spreadsheet is None:
+            sheet_id = st.secrets["google"].get("spreadsheet_id")
+            if not sheet_id: return None
+            pool.spreadsheet = client.open_by_key(sheet_id)
+        return pool.spreadsheet
+
+def _get_worksheet(client, sheet_name):
+    """مقبض ورقة من المخزن، يرفع WorksheetNotFound إذا لم تكن موجودة"""
+    sh = _get_spreadsheet(client)
+    if sh is None: raise WorksheetNotFound(sheet_name)
+    pool = _get_handle_pool()
+    with pool.lock:
+        ws = pool.worksheets.get(sheet_name)
+    if ws is not None: return ws
+    ws = sh.worksheet(sheet_name)
+    with pool.lock:
+        if pool.spreadsheet is sh: pool.worksheets[sheet_name] = ws
+    return ws
+
+def _create_worksheet(client, sheet_name, headers=None):
+    """إنشاء ورقة جديدة وتسجيل مقبضها في المخزن"""
+    sh = _get_spreadsheet(client)
+    ws = sh.add_worksheet(title=sheet_name, rows=100, cols=20)
+    if headers: ws.append_row(headers)
+    with _get_handle_pool().lock:
+        _get_handle_pool().worksheets[sheet_name] = ws
+    return ws
+
+def forget_worksheet(sheet_name):
+    """إسقاط مقبض ورقة (مثلاً بعد حذفها أو تغييرها من خارج التطبيق)"""
+    pool = _get_handle_pool()
+    with pool.lock:
+        pool.worksheets.pop(sheet_name, None)
+
+def refresh_worksheets():
+    """إعادة تحميل كل مقابض الأوراق بطلب واحد (fetch_sheet_metadata)"""
+    client = get_connection()
+    if not client: return False
+    pool = _get_handle_pool()
+    with pool.lock: pool.reset(client)
+    sh = _get_spreadsheet(client)
+    if sh is None: return False
+    wss = _execute_with_retry(sh.worksheets)
+    if wss is None: return False
+    with pool.lock:
+        pool.worksheets = {ws.title: ws for ws in wss}
+    return True
+
+def rename_worksheet(old_name, new_name):
+    """إعادة تسمية ورقة مع تحديث المخزن والكاش"""
+    client = get_connection()
+    if not client: return False
+    def _rename():
+        ws = _get_worksheet(client, old_name)
+        ws.update_title(new_name)
+        return ws
+    ws = _execute_with_retry(_rename)
+    if ws is None: return False
+    pool = _get_handle_pool()
+    with pool.lock:
+        pool.worksheets.pop(old_name, None)
+        pool.worksheets[new_name] = ws
+    invalidate_table(old_name)
+    invalidate_table(new_name)
+    return True
+
 # --- دوال التعامل مع البيانات (Data Operations) ---
 
-@st.cache_data(ttl=300)
-def get_data(sheet_name):
+# --- كاش الجداول (Per-table Cache) ---
+# كل جدول له مدخل مستقل في الكاش ومدة صلاحية خاصة به، والكتابة على جدول
+# تلغي كاش ذلك الجدول فقط بدلاً من st.cache_data.clear() الذي يمسح كل شيء
+
+DEFAULT_TABLE_TTL = 300
+
+# مدة الصلاحية بالثواني لكل جدول (يمكن تجاوزها من secrets تحت [cache_ttl])
+TABLE_TTLS = {
+    TABLE_USERS: 300,
+    TABLE_ROLES: 3600,
+    TABLE_SECTIONS: 900,
+    TABLE_TABS: 900,
+    TABLE_CATEGORIES: 900,
+    TABLE_CONTENT: 300,
+    TABLE_PERMISSIONS: 300,
+    TABLE_MEDIA: 300,
+    TABLE_CHECKLISTS: 120,
+    TABLE_SETTINGS: 900,
+    TABLE_COMMENTS: 120,
+}
+
+class _TableCache:
+    """مخزن مشترك على مستوى العملية: جدول -> (DataFrame، وقت الجلب، رقم النسخة)"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.generations = {}
+        self.fetch_locks = {}
+        self.write_locks = {}
+        self.stats = {}
+        self.row_indexes = {}
+        self.derived = {}
+        self.last_good = {}  # آخر نسخة ناجحة (تبقى بعد الإبطال) لعرضها عند تعطل Google
+        self.sources = {}    # نسخة ملف الشيت في Drive وقت جلب الجدول
+        self.loaded_at = {}  # وقت آخر جلب كامل (الجداول الإلحاقية تُحدث بالذيل بين الجلبات الكاملة)
+        self.fetched_at = {} # وقت آخر جلب (كامل أو ذيل)
+        self._version_counter = 0
+
+    def _stat(self, table):
+        return self.stats.setdefault(table, {"hits": 0, "misses": 0, "invalidations": 0, "revalidations": 0, "tail_fetches": 0})
+
+    def fetch_lock(self, table):
+        with self.lock:
+            return self.fetch_locks.setdefault(table, threading.Lock())
+
+    def write_lock(self, table):
+        """قفل الكتابة للجدول: تحديد موقع الصف والكتابة وتحديث الفهرس خطوة واحدة"""
+        with self.lock:
+            return self.write_locks.setdefault(table, threading.RLock())
+
+    def lookup(self, table, ttl, count=True):
+        with self.lock:
+            entry = self.entries.get(table)
+            if entry and time.time() - entry[1] < ttl:
+                if count: self._stat(table)["hits"] += 1
+                return entry[0]
+            return None
+
+    def generation(self, table):
+        with self.lock:
+            return self.generations.get(table, 0)
+
+    def store(self, table, df, generation, source=None, full=True):
+        with self.lock:
+            self._stat(table)["misses" if full else "tail_fetches"] += 1
+            # إذا حدثت كتابة أثناء الجلب فالنتيجة قد تكون قديمة فلا نخزنها
+            if self.generations.get(table, 0) != generation: return
+            self._version_counter += 1
+            self.entries[table] = (df, time.time(), self._version_counter)
+            self.last_good[table] = df
+            self.sources[table] = source
+            self.fetched_at[table] = time.time()
+            if full: self.loaded_at[table] = self.fetched_at[table]
+            # بيانات جديدة من الشيت: فهارس الصفوف تُبنى من جديد عند الحاجة
+            for key in [k for k in self.row_indexes if k[0] == table]:
+                del self.row_indexes[key]
+
+    def invalidate(self, table):
+        with self.lock:
+            self.generations[table] = self.generations.get(table, 0) + 1
+            self.entries.pop(table, None)
+            self.sources.pop(table, None)
+            self._stat(table)["invalidations"] += 1
+
+    def expire(self, table):
+        """مثل invalidate لكن تبقى البيانات أساساً لجلب الصفوف الجديدة فقط (بعد الإضافة)"""
+        with self.lock:
+            self.generations[table] = self.generations.get(table, 0) + 1
+            entry = self.entries.get(table)
+            if entry: self.entries[table] = (entry[0], 0, entry[2])
+            self.sources.pop(table, None)
+            self._stat(table)["invalidations"] += 1
+
+    def tail_base(self, table, max_age):
+        """النسخة المخزنة (ولو منتهية) إذا كان آخر جلب كامل لها أحدث من max_age"""
+        with self.lock:
+            entry = self.entries.get(table)
+            if entry is None or time.time() - self.loaded_at.get(table, 0) >= max_age: return None
+            return entry[0]
+
+    def version(self, table):
+        with self.lock:
+            entry = self.entries.get(table)
+            return entry[2] if entry else 0
+
+    def revalidate(self, table, source):
+        """الملف لم يتغير منذ جلب الجدول: نمدد صلاحيته بدون جلب جديد (نفس رقم النسخة)"""
+        with self.lock:
+            entry = self.entries.get(table)
+            if entry is None or source is None or self.sources.get(table) != source: return None
+            self.entries[table] = (entry[0], time.time(), entry[2])
+            self._stat(table)["revalidations"] += 1
+            return entry[0]
+
+    def fetched(self, *tables):
+        with self.lock:
+            return max((self.fetched_at.get(t, 0.0) for t in tables), default=0.0)
+
+    def stale(self, table):
+        with self.lock:
+            return self.last_good.get(table)
+
+@st.cache_resource
+def _get_table_cache():
+    return _TableCache()
+
+def get_table_ttl(sheet_name):
+    """مدة صلاحية كاش الجدول بالثواني"""
+    try:
+        overrides = st.secrets.get("cache_ttl", {})
+        if sheet_name in overrides: return int(overrides[sheet_name])
+    except Exception: pass
+    return TABLE_TTLS.get(sheet_name, DEFAULT_TABLE_TTL)
+
+def set_table_ttl(sheet_name, seconds):
+    TABLE_TTLS[sheet_name] = int(seconds)
+
+def invalidate_table(sheet_name):
+    """إلغاء كاش جدول واحد فقط بعد الكتابة عليه"""
+    _get_table_cache().invalidate(sheet_name)
+
+def get_table_version(sheet_name):
+    """رقم نسخة بيانات الجدول المخزنة (يتغير مع كل جلب جديد أو إلغاء)"""
+    return _get_table_cache().version(sheet_name)
+
+def get_cache_stats():
+    """إحصائيات الكاش لكل جدول (hits / misses / invalidations / revalidations / tail_fetches)"""
+    cache = _get_table_cache()
+    with cache.lock:
+        now = time.time()
+        rows = []
+        for table, s in sorted(cache.stats.items()):
+            entry = cache.entries.get(table)
+            rows.append({
+                "table": table,
+                "hits": s["hits"],
+                "misses": s["misses"],
+                "invalidations": s["invalidations"],
+                "revalidations": s["revalidations"],
+                "tail_fetches": s["tail_fetches"],
+                "ttl": get_table_ttl(table),
+                "age": round(now - entry[1], 1) if entry else None,
+                "rows": len(entry[0]) if entry else 0,
+            })
+        return rows
+
+# --- التحقق من حداثة الكاش (Freshness Validation) ---
+# عند انتهاء صلاحية جدول نسأل Drive عن نسخة ملف الشيت (طلب صغير واحد) بدلاً من
+# تحميل الجدول كاملاً؛ إذا لم يتغير الملف منذ الجلب السابق يُمدد الكاش كما هو.
+# النسخة على مستوى الملف كله: أي تعديل في أي ورقة يعني جلب الجداول المنتهية من جديد
+
+FRESHNESS_CHECK_INTERVAL = 5  # ثوانٍ: الجداول التي تنتهي معاً تشترك في فحص واحد
+FRESHNESS_WAIT = 1  # أقصى انتظار لفحص تجريه جلسة أخرى قبل المتابعة بالجلب المعتاد
+
+@st.cache_resource
+def _get_version_probe():
+    # checked وstarted وقت بدء الطلب: نتيجته تصف الملف في تلك اللحظة
+    return {"lock": threading.Lock(), "value": None, "checked": 0.0, "inflight": None, "started": 0.0}
+
+def _freshness_enabled():
+    try: return bool(st.secrets.get("freshness", {}).get("enabled", True))
+    except Exception: return True
+
+def _spreadsheet_version(since=0.0):
+    """(version, modifiedTime) لملف الشيت من Drive، أو None إذا تعذر التحقق
+    since: وقت آخر جلب للجدول، فلا يُستخدم فحص مشترك بدأ قبله (قد يسبق تعديلاً جلبه الجدول)"""
+    if not _freshness_enabled(): return None
+    probe = _get_version_probe()
+    with probe["lock"]:
+        now = time.time()
+        if probe["checked"] > since and now - probe["checked"] < FRESHNESS_CHECK_INTERVAL: return probe["value"]
+        done = probe["inflight"]
+        # فحص جارٍ بدأ قبل آخر جلب للجدول لا يفيده، فيبدأ فحصاً خاصاً به
+        owner = done is None or probe["started"] <= since
+        if owner:
+            done = probe["inflight"] = threading.Event()
+            started = probe["started"] = now
+    if not owner:
+        # فحص واحد في نفس اللحظة (single-flight)، والقفل لا يُمسك أثناء طلب الشبكة:
+        # فحص بطيء لا يوقف قراءة الجداول، فمن ينتظر أكثر من FRESHNESS_WAIT يكمل بالجلب
+        # المعتاد المحمي بقفل كل جدول على حدة
+        if not done.wait(FRESHNESS_WAIT): return None
+        with probe["lock"]: return probe["value"]
+    value = None
+    try:
+        service = _get_drive_service()
+        sheet_id = st.secrets["google"].get("spreadsheet_id")
+        if service is not None and sheet_id:
+            request = service.files().get(fileId=sheet_id, fields="modifiedTime,version", supportsAllDrives=True)
+            meta = _call_api(request.execute, service="drive", deadline=5)
+            value = (meta.get("version"), meta.get("modifiedTime"))
+    except BackendError:
+        value = None
+    finally:
+        with probe["lock"]:
+            # فحصان متزامنان: لا تحل النتيجة الأقدم محل الأحدث
+            if started >= probe["checked"]: probe["value"], probe["checked"] = value, started
+            if probe["inflight"] is done: probe["inflight"] = None
+        done.set()
+    return value
+
+# --- تحميل الجداول بأنواع أعمدة محددة (Typed Columnar Loading) ---
+# الجدول يُبنى عموداً عموداً من القيم الخام بنوع معلن لكل عمود، فيُخزن في الكاش
+# مرة واحدة بأنواعه الصحيحة بدلاً من تحويل القيم في كل استدعاء:
+#   text      نص كما هو (المعرفات الرئيسية: قيم فريدة لا يفيدها category)
+#   category  قيم متكررة (معرفات الربط، الحالة، النوع، الكاتب)
+#   code      رقم متكرر (role_id)
+#   number    رقم (sort_order)، والقيمة غير الرقمية تصبح NaN
+#   bool      TRUE/True -> True وغير ذلك False
+#   date / datetime  تاريخ، ويُعرض في الموديلات بنفس صيغة الكتابة
+# الأعمدة غير المعلنة تبقى كما يرجعها get_all_records (تحويل الأرقام فقط)
+
+TABLE_SCHEMAS = {
+    TABLE_USERS: {'user_id': 'text', 'name': 'text', 'email': 'text', 'password_hash': 'text',
+                  'role_id': 'code', 'status': 'category', 'created_at': 'date'},
+    TABLE_SECTIONS: {'section_id': 'text', 'created_by': 'category', 'created_at': 'date',
+                     'sort_order': 'number', 'is_public': 'bool'},
+    TABLE_TABS: {'tab_id': 'text', 'section_id': 'category', 'created_by': 'category',
+                 'created_at': 'date', 'sort_order': 'number'},
+    TABLE_CATEGORIES: {'category_id': 'text', 'tab_id': 'category', 'created_by': 'category',
+                       'created_at': 'date', 'sort_order': 'number'},
+    TABLE_CONTENT: {'content_id': 'text', 'category_id': 'category', 'content_type': 'category',
+                    'created_by': 'category', 'created_at': 'date'},
+    TABLE_PERMISSIONS: {'permission_id': 'text', 'user_id': 'category', 'section_id': 'category',
+                        'tab_id': 'category', 'content_id': 'category',
+                        'view': 'bool', 'edit': 'bool', 'hidden': 'bool'},
+    TABLE_MEDIA: {'media_id': 'text', 'file_type': 'category', 'google_drive_id': 'text',
+                  'uploaded_by': 'category', 'uploaded_at': 'date'},
+    TABLE_CHECKLISTS: {'item_id': 'text', 'main_title': 'category', 'sub_title': 'category',
+                       'is_checked': 'bool', 'created_by': 'category'},
+    TABLE_SETTINGS: {'setting_key': 'text', 'updated_by': 'category', 'updated_at': 'datetime'},
+    TABLE_COMMENTS: {'comment_id': 'text', 'content_id': 'category', 'user_name': 'category',
+                     'created_at': 'datetime'},
+}
+
+DATE_FORMATS = {'date': "%Y-%m-%d", 'datetime': "%Y-%m-%d %H:%M:%S"}
+
+def _typed_column(kind, values):
+    """عمود واحد من القيم الخام (نصوص) بالنوع المعلن"""
+    if kind is None: return pd.Series(gspread.utils.numericise_all(list(values)), dtype=None if values else object)
+    s = pd.Series(values, dtype=object)
+    if kind == 'text': return s
+    if kind == 'category': return s.astype('category')
+    if kind == 'code': return pd.to_numeric(s, errors='coerce').astype('category')
+    if kind == 'number': return pd.to_numeric(s, errors='coerce')
+    if kind == 'bool': return s.str.strip().str.lower() == 'true'
+    # التواريخ المكتوبة من التطبيق ISO؛ المدخلة يدوياً بصيغ أخرى تُحلل منفردة
+    parsed = pd.to_datetime(s, format='ISO8601', errors='coerce')
+    bad = parsed.isna() & (s.str.strip() != '')
+    if bad.any(): parsed[bad] = pd.to_datetime(s[bad], format='mixed', errors='coerce')
+    return parsed
+
+def _frame_from_values(values, sheet_name=None):
+    """تحويل قيم الورقة الخام إلى DataFrame بأنواع أعمدة الجدول المعلنة"""
+    if not values or not values[0]: return pd.DataFrame()
+    values = gspread.utils.fill_gaps(values)
+    keys, schema = values[0], TABLE_SCHEMAS.get(sheet_name, {})
+    columns = list(zip(*values[1:])) or [()] * len(keys)
+    return pd.DataFrame({k: _typed_column(schema.get(k), col) for k, col in zip(keys, columns)})
+
+def _concat_typed(df, new):
+    """إلحاق صفوف بجدول مع الإبقاء على أعمدة category (الدمج العادي يحولها إلى object)"""
+    out = pd.concat([df, new], ignore_index=True)
+    for c in df.columns:
+        if isinstance(df[c].dtype, pd.CategoricalDtype): out[c] = out[c].astype('category')
+    return out
+
+def _format_dates(series):
+    """عمود تاريخ -> نصوص بصيغة الكتابة (بدون الوقت إذا كانت كل القيم تواريخ فقط)"""
+    if not pd.api.types.is_datetime64_any_dtype(series): return series
+    fmt = DATE_FORMATS['date'] if (series.dropna().dt.normalize() == series.dropna()).all() else DATE_FORMATS['datetime']
+    return series.dt.strftime(fmt).fillna("")
+
+@_timed("fetch_table", 0)
+def _fetch_table(sheet_name):
     client = get_connection()
-    if not client: return pd.DataFrame()
+    if not client: return None
     def _fetch():
         try:
-            sheet_id = st.secrets["google"].get("spreadsheet_id")
-            if not sheet_id: return pd.DataFrame()
-
-            sh = client.open_by_key(sheet_id)
-            ws = sh.worksheet(sheet_name)
-            data = ws.get_all_records()
-            return pd.DataFrame(data)
+            ws = _get_worksheet(client, sheet_name)
+            return _frame_from_values(ws.get_all_values(), sheet_name)
         except WorksheetNotFound: return pd.DataFrame()
+        except APIError:
+            forget_worksheet(sheet_name)
+            raise
         except gspread.exceptions.GSpreadException: return pd.DataFrame() 
         except Exception as e: 
+            # أخطاء الشبكة تمر لسياسة إعادة المحاولة بدلاً من تخزين جدول فارغ
+            if _classify_error(e) is not None: raise
             print(f"Error fetching data: {e}")
             return pd.DataFrame()
 
-    res = _execute_with_retry(_fetch)
-    return res if res is not None else pd.DataFrame()
+    return _execute_with_retry(_fetch)
+
+# --- الجلب التزايدي للجداول الإلحاقية (Incremental Tail Fetch) ---
+# التعليقات والمحتوى والوسائط تنمو بالإضافة فقط، فعند انتهاء صلاحيتها نجلب
+# الصفوف بعد آخر صف معروف بدلاً من الجدول كاملاً. الطلب يبدأ من آخر صف مخزن
+# نفسه: إذا تغير أو اختفى (حذف أو تقلص من خارج التطبيق) نرجع للجلب الكامل.
+
+APPEND_ONLY_TABLES = {TABLE_COMMENTS, TABLE_CONTENT, TABLE_MEDIA}
+FULL_RELOAD_INTERVAL = 3600  # جلب كامل دوري لالتقاط أي تعديل داخل الصفوف القديمة
+
+def _tail_base(sheet_name):
+    if sheet_name not in APPEND_ONLY_TABLES: return None
+    base = _get_table_cache().tail_base(sheet_name, FULL_RELOAD_INTERVAL)
+    return base if base is not None and not base.empty else None
+
+def _same_row(a, b):
+    # 1 و 1.0 متساويان، و NaN/NaT تُقارن كنص
+    return all(x == y or str(x) == str(y) for x, y in zip(a, b))
+
+@_timed("fetch_tail", 0)
+def _fetch_tail(sheet_name, base):
+    """base + الصفوف المضافة بعده، أو None إذا لزم جلب كامل"""
+    client = get_connection()
+    if not client: return None
+    headers = [str(c) for c in base.columns]
+    last_row = len(base) + 1  # الصف 1 للعناوين
+    last_col = re.sub(r"\d", "", gspread.utils.rowcol_to_a1(1, len(headers)))
+    name = "'{}'".format(sheet_name.replace("'", "''"))
+    def _tail():
+        sh = _get_spreadsheet(client)
+        if sh is None: return None
+        # العناوين وذيل الجدول في طلب واحد
+        res = sh.values_batch_get([f"{name}!1:1", f"{name}!A{last_row}:{last_col}"])
+        return [vr.get("values", []) for vr in res.get("valueRanges", [])]
+
+    ranges = _execute_with_retry(_tail)
+    if not ranges or len(ranges) != 2: return None
+    header_row, tail = ranges
+    if not header_row or [str(h) for h in header_row[0]] != headers: return None
+    if not tail: return None
+    frame = _frame_from_values([headers] + [r[:len(headers)] for r in tail], sheet_name)
+    if not _same_row(frame.iloc[0].tolist(), base.iloc[-1].tolist()): return None
+    if len(frame) == 1: return base
+    return _concat_typed(base, frame.iloc[1:])
+
+def _get_table(sheet_name):
+    """الجدول كما هو في الشيت (من الكاش أو بجلب جديد)"""
+    cache = _get_table_cache()
+    ttl = get_table_ttl(sheet_name)
+    df = cache.lookup(sheet_name, ttl)
+    if df is not None: return df
+
+    # قفل لكل جدول حتى لا تجلب عدة جلسات نفس الجدول في نفس اللحظة
+    with cache.fetch_lock(sheet_name):
+        df = cache.lookup(sheet_name, ttl)
+        if df is not None: return df
+        # النسخة تُقرأ قبل الجلب: لو تغير الملف أثناءه يُكتشف في الفحص التالي
+        source = _spreadsheet_version(cache.fetched(sheet_name))
+        df = cache.revalidate(sheet_name, source)
+        if df is not None: return df
+        generation = cache.generation(sheet_name)
+        base = _tail_base(sheet_name)
+        df = _fetch_tail(sheet_name, base) if base is not None else None
+        if df is not None:
+            cache.store(sheet_name, df, generation, source, full=False)
+            return df
+        df = _fetch_table(sheet_name)
+        if df is None:
+            # Google لا يستجيب: نعرض آخر نسخة محفوظة بدلاً من جدول فارغ
+            stale = cache.stale(sheet_name)
+            return stale if stale is not None else pd.DataFrame()
+        cache.store(sheet_name, df, generation, source)
+        return df
+
+# --- الفهارس المشتقة (Derived Indexes) ---
+# فهارس تُبنى من جدول أو أكثر مرة واحدة لكل نسخة بيانات، وتشترك فيها كل الجلسات
+
+def _has_pending_overlay(tables):
+    if not _write_behind_enabled(): return False
+    session_id = _current_session_id()
+    return any(_get_write_behind().pending_for(t, session_id) for t in tables)
+
+def _get_derived(name, tables, build):
+    """نتيجة build(*frames) من الكاش ما دامت نسخ الجداول لم تتغير"""
+    frames = [get_data(t) for t in tables]
+    # الجلسة التي لديها كتابات معلقة ترى نسخة خاصة بها فلا نخزنها
+    if _has_pending_overlay(tables): return build(*frames)
+    cache = _get_table_cache()
+    with cache.lock:
+        # النسخة تُؤخذ فقط إذا كان الإطار المجلوب هو نفسه المخزن: لو تحدث الجدول بعد
+        # get_data لا تُخزن نتيجة مبنية من الإطار القديم تحت رقم النسخة الجديدة
+        entries = [cache.entries.get(t) for t in tables]
+        versions = tuple(e[2] if e is not None and e[0] is f else 0 for e, f in zip(entries, frames))
+        entry = cache.derived.get(name)
+    if entry and entry[0] == versions: return entry[1]
+    value = build(*frames)
+    if 0 not in versions:
+        with cache.lock: cache.derived[name] = (versions, value)
+    return value
+
+def _sort_key(value):
+    try: value = float(value)
+    except (TypeError, ValueError): return float("inf")
+    return value if value == value else float("inf")
+
+# --- الجلب المسبق لعدة جداول (Multi-table Prefetch) ---
+# الصفحة تعلن مسبقاً عن الجداول التي تحتاجها، فتُجلب كلها بطلب values_batch_get
+# واحد بدلاً من طلب get_all_records لكل جدول
+
+@_timed("prefetch_tables")
+def prefetch_tables(sheet_names):
+    """تعبئة كاش الجداول المطلوبة التي انتهت صلاحيتها بطلب واحد"""
+    cache = _get_table_cache()
+    missing = [n for n in dict.fromkeys(sheet_names) if cache.lookup(n, get_table_ttl(n), count=False) is None]
+    if not missing: return True
+    source = _spreadsheet_version(cache.fetched(*missing))
+    missing = [n for n in missing if cache.revalidate(n, source) is None]
+    # الجداول الإلحاقية المخزنة تُحدث بجلب ذيلها فقط بدلاً من الطلب المجمع الكامل
+    for n in [n for n in missing if _tail_base(n) is not None]:
+        _get_table(n)
+        missing.remove(n)
+    if not missing: return True
+    # جدول واحد لا يحتاج طلباً مجمعاً
+    if len(missing) == 1:
+        _get_table(missing[0])
+        return True
 
-def add_row(sheet_name, row_data_list, new_sheet_headers=None):
     client = get_connection()
     if not client: return False
-    def _add():
-        sheet_id = st.secrets["google"].get("spreadsheet_id")
-        if not sheet_id: return False
+    generations = {n: cache.generation(n) for n in missing}
+    def _batch():
+        sh = _get_spreadsheet(client)
+        if sh is None: return None
+        ranges = ["'{}'".format(n.replace("'", "''")) for n in missing]
+        return sh.values_batch_get(ranges).get("valueRanges", [])
+
+    value_ranges = _execute_with_retry(_batch)
+    if value_ranges is None or len(value_ranges) != len(missing):
+        # مثلاً إذا كانت إحدى الأوراق غير موجودة: نرجع للجلب المنفرد
+        for n in missing: _get_table(n)
+        return False
+    for name, vr in zip(missing, value_ranges):
+        cache.store(name, _frame_from_values(vr.get("values", []), name), generations[name], source)
+    return True
+
+@_timed("get_data", 0)
+def get_data(sheet_name):
+    """جلب جدول كامل من الكاش أو من قوقل شيت (النتيجة مشتركة: للقراءة فقط)"""
+    df = _get_table(sheet_name)
+    if _write_behind_enabled():
+        pending = _get_write_behind().pending_for(sheet_name, _current_session_id())
+        if pending: df = _apply_pending_overlay(df, pending, sheet_name)
+    return df
 
-        sh = client.open_by_key(sheet_id)
+# --- فهرس مواقع الصفوف (Row-location Index) ---
+# معرف -> رقم الصف في الشيت، يُبنى من عمود المعرف في البيانات المجلوبة مسبقاً
+# ويُحدّث مع الإضافة والحذف، فيصبح التعديل والحذف طلباً واحداً مباشراً بدلاً من ws.find()
+
+class _RowIndex:
+    def __init__(self, headers, id_column, ids):
+        self.headers = list(headers)
+        self.id_column = id_column
+        self.rows = {}
+        for i, v in enumerate(ids):
+            # الصف 1 للعناوين، والبيانات تبدأ من الصف 2
+            self.rows.setdefault(str(v), i + 2)
+
+    def col(self, name):
+        return self.headers.index(name) + 1 if name in self.headers else None
+
+    def appended(self, rows, first_row):
+        pos = self.headers.index(self.id_column)
+        for i, r in enumerate(rows):
+            if len(r) > pos: self.rows.setdefault(str(r[pos]), first_row + i)
+
+    def deleted(self, row):
+        self.rows = {k: (v - 1 if v > row else v) for k, v in self.rows.items() if v != row}
+
+def _get_row_index(sheet_name, id_column):
+    """فهرس الصفوف للجدول (None إذا لم يكن الجدول أو عمود المعرف موجوداً)"""
+    cache = _get_table_cache()
+    key = (sheet_name, id_column)
+    with cache.lock:
+        idx = cache.row_indexes.get(key)
+    if idx is not None: return idx
+
+    generation = cache.generation(sheet_name)
+    df = _get_table(sheet_name)
+    if df.empty or id_column not in df.columns: return None
+    idx = _RowIndex(df.columns, id_column, df[id_column].tolist())
+    with cache.lock:
+        # لا نحفظ فهرساً مبنياً من بيانات سبقت كتابة حدثت أثناء البناء
+        if cache.generations.get(sheet_name, 0) != generation: return idx
+        return cache.row_indexes.setdefault(key, idx)
+
+def _drop_row_indexes(sheet_name):
+    cache = _get_table_cache()
+    with cache.lock:
+        for key in [k for k in cache.row_indexes if k[0] == sheet_name]:
+            del cache.row_indexes[key]
+
+def _row_index_appended(sheet_name, rows, response):
+    cache = _get_table_cache()
+    first_row = _parse_appended_row(response)
+    with cache.lock:
+        for key in [k for k in cache.row_indexes if k[0] == sheet_name]:
+            if first_row is None: del cache.row_indexes[key]
+            else: cache.row_indexes[key].appended(rows, first_row)
+
+def _row_index_deleted(sheet_name, row):
+    cache = _get_table_cache()
+    with cache.lock:
+        for key in [k for k in cache.row_indexes if k[0] == sheet_name]:
+            cache.row_indexes[key].deleted(row)
+
+def _parse_appended_row(response):
+    """رقم أول صف تمت إضافته من رد values_append"""
+    try:
+        rng = response['updates']['updatedRange']
+        return int(re.search(r'!\$?[A-Z]+\$?(\d+)', rng).group(1))
+    except Exception: return None
+
+def _locate_row(ws, idx, id_column, id_value, sheet_name=None):
+    """رقم صف المعرف: من الفهرس بعد قراءة خلية المعرف فيه للتأكد، وإلا بحث محصور في عمود المعرف"""
+    headers = idx.headers if idx is not None else ws.row_values(1)
+    if id_column not in headers: return None
+    col = headers.index(id_column) + 1
+    if idx is not None:
+        row = idx.rows.get(str(id_value))
+        if row:
+            if str(ws.cell(row, col).value) == str(id_value): return row
+            # الصفوف تحركت (تعديل مباشر في الشيت مثلاً): الفهرس لم يعد صالحاً
+            if sheet_name: _drop_row_indexes(sheet_name)
+    cell = ws.find(str(id_value), in_column=col)
+    return cell.row if cell else None
+
+# --- عمليات الكتابة المباشرة ---
+# ترجع None عند فشل الاتصال بالـ API حتى يميز طابور الكتابة المؤجلة بين
+# "فشل مؤقت يعاد لاحقاً" و "الصف غير موجود"
+
+def _add_rows_now(sheet_name, rows, new_sheet_headers=None):
+    client = get_connection()
+    if not client: return None
+    def _add():
+        if _get_spreadsheet(client) is None: return False
         try: 
-            ws = sh.worksheet(sheet_name)
+            ws = _get_worksheet(client, sheet_name)
         except WorksheetNotFound: 
-            ws = sh.add_worksheet(title=sheet_name, rows=100, cols=20)
-            if new_sheet_headers:
-                ws.append_row(new_sheet_headers)
-        
-        ws.append_row(row_data_list)
+            ws = _create_worksheet(client, sheet_name, new_sheet_headers)
+
+        with _get_table_cache().write_lock(sheet_name):
+            res = ws.append_rows(rows)
+            _row_index_appended(sheet_name, rows, res)
         return True
-    
-    result = _execute_with_retry(_add)
+
+    result = _execute_with_retry(_add, retry_transient=False)
+    if result is None: forget_worksheet(sheet_name)
     if result is True:
-        st.cache_data.clear()
-        return True
-    return False
+        # الإضافة لا تغير الصفوف الموجودة: يكفي جلب الذيل في القراءة التالية
+        if sheet_name in APPEND_ONLY_TABLES: _get_table_cache().expire(sheet_name)
+        else: invalidate_table(sheet_name)
+    return result
 
-def delete_row(sheet_name, id_column, id_value):
+def _delete_row_now(sheet_name, id_column, id_value):
     client = get_connection()
-    if not client: return False
+    if not client: return None
     def _del():
-        sheet_id = st.secrets["google"].get("spreadsheet_id")
-        sh = client.open_by_key(sheet_id)
-        ws = sh.worksheet(sheet_name)
-        cell = ws.find(str(id_value))
-        if cell: ws.delete_rows(cell.row); return True
-        return False
-        
-    result = _execute_with_retry(_del)
-    if result is True:
-        st.cache_data.clear()
+        ws = _get_worksheet(client, sheet_name)
+        with _get_table_cache().write_lock(sheet_name):
+            idx = _get_row_index(sheet_name, id_column)
+            row = _locate_row(ws, idx, id_column, id_value, sheet_name)
+            if not row: return False
+            ws.delete_rows(row)
+            _row_index_deleted(sheet_name, row)
         return True
-    return False
+        
+    result = _execute_with_retry(_del, retry_transient=False)
+    if result is None: forget_worksheet(sheet_name)
+    if result is True: invalidate_table(sheet_name)
+    return result
 
-def update_field(sheet_name, id_column, id_value, target_column, new_value):
+def _update_field_now(sheet_name, id_column, id_value, target_column, new_value):
     client = get_connection()
-    if not client: return False
+    if not client: return None
     def _upd():
-        sheet_id = st.secrets["google"].get("spreadsheet_id")
-        sh = client.open_by_key(sheet_id)
-        ws = sh.worksheet(sheet_name)
-        cell = ws.find(str(id_value))
-        if not cell: return False
-        headers = ws.row_values(1)
-        try: 
-            col_index = headers.index(target_column) + 1
-            ws.update_cell(cell.row, col_index, new_value)
-            return True
-        except: return False
+        ws = _get_worksheet(client, sheet_name)
+        with _get_table_cache().write_lock(sheet_name):
+            idx = _get_row_index(sheet_name, id_column)
+            row = _locate_row(ws, idx, id_column, id_value, sheet_name)
+            if not row: return False
+            headers = idx.headers if idx is not None else ws.row_values(1)
+            if target_column not in headers: return False
+            ws.update_cell(row, headers.index(target_column) + 1, new_value)
+        return True
         
     result = _execute_with_retry(_upd)
-    if result is True:
-        st.cache_data.clear()
+    if result is None: forget_worksheet(sheet_name)
+    if result is True: invalidate_table(sheet_name)
+    return result
+
+def _update_fields_now(sheet_name, id_column, updates):
+    client = get_connection()
+    if not client: return None
+    def _upd():
+        ws = _get_worksheet(client, sheet_name)
+        with _get_table_cache().write_lock(sheet_name):
+            idx = _get_row_index(sheet_name, id_column)
+            headers = idx.headers if idx is not None else ws.row_values(1)
+            if id_column not in headers: raise RequestError(f"العمود {id_column} غير موجود في {sheet_name}")
+            # مواقع الصفوف تُقرأ من عمود المعرف نفسه (طلب واحد) لا من الفهرس الذي قد يكون قديماً
+            ids = ws.col_values(headers.index(id_column) + 1)
+            rows = {}
+            for i, v in enumerate(ids[1:]): rows.setdefault(str(v), i + 2)
+
+            data, missing = [], set()
+            for id_value, target_column, new_value in updates:
+                row = rows.get(str(id_value))
+                if row is None:
+                    missing.add(str(id_value))
+                    continue
+                # عمود غير موجود في الشيت يُتجاهل، والمعرف نفسه ليس مفقوداً
+                if target_column not in headers: continue
+                col = headers.index(target_column) + 1
+                data.append({'range': gspread.utils.rowcol_to_a1(row, col), 'values': [[new_value]]})
+            if data: ws.batch_update(data)
+        return missing
+
+    result = _execute_with_retry(_upd)
+    if result is None:
+        forget_worksheet(sheet_name)
+        return None
+    invalidate_table(sheet_name)
+    return result
+
+# --- الواجهة العامة للكتابة ---
+# في وضع الكتابة المؤجلة (write-behind) تُسجل العملية في السجل المحلي وترجع فوراً
+
+def add_row(sheet_name, row_data_list, new_sheet_headers=None):
+    return add_rows(sheet_name, [row_data_list], new_sheet_headers=new_sheet_headers)
+
+@_timed("delete_row", 0)
+def delete_row(sheet_name, id_column, id_value):
+    if _write_behind_active():
+        return _get_write_behind().enqueue("delete_row", sheet_name, id_column=id_column, id_value=str(id_value))
+    return _delete_row_now(sheet_name, id_column, id_value) is True
+
+@_timed("update_field", 0)
+def update_field(sheet_name, id_column, id_value, target_column, new_value):
+    if _write_behind_active():
+        return _get_write_behind().enqueue("update_fields", sheet_name, id_column=id_column, updates=[(str(id_value), target_column, new_value)])
+    return _update_field_now(sheet_name, id_column, id_value, target_column, new_value) is True
+
+# --- الكتابة المجمعة (Batch Writes) ---
+# إضافة عدة صفوف أو تعديل عدة خلايا في طلب API واحد بدلاً من طلب لكل صف
+
+@_timed("add_rows", 0)
+def add_rows(sheet_name, rows, new_sheet_headers=None):
+    """إضافة عدة صفوف بطلب values_append واحد"""
+    if not rows: return True
+    rows = [list(r) for r in rows]
+    if _write_behind_active():
+        return _get_write_behind().enqueue("add_rows", sheet_name, rows=rows, headers=new_sheet_headers)
+    return _add_rows_now(sheet_name, rows, new_sheet_headers) is True
+
+@_timed("update_fields", 0)
+def update_fields(sheet_name, id_column, updates):
+    """تعديل عدة خلايا بطلب batch_update واحد
+    updates: قائمة من (id_value, target_column, new_value)
+    يرجع مجموعة المعرفات التي لم يتم العثور عليها (الأعمدة غير الموجودة تُتجاهل)"""
+    if not updates: return set()
+    if _write_behind_active():
+        df = get_data(sheet_name)
+        present = set(df[id_column].astype(str)) if id_column in df.columns else set()
+        missing = {str(u[0]) for u in updates if str(u[0]) not in present}
+        found = [(str(i), c, v) for i, c, v in updates if str(i) not in missing]
+        if found and not _get_write_behind().enqueue("update_fields", sheet_name, id_column=id_column, updates=found):
+            return None
+        return missing
+    return _update_fields_now(sheet_name, id_column, updates)
+
+# --- الكتابة المؤجلة (Write-behind Queue) ---
+# العمليات تُكتب أولاً في سجل محلي دائم (JSONL) ثم يرسلها عامل في الخلفية
+# إلى قوقل شيت على دفعات مدمجة. عند إعادة تشغيل السيرفر أو انقطاع الحصة
+# تُعاد العمليات غير المرسلة من السجل. الجلسة التي أجرت التعديل ترى تعديلاتها
+# فوراً عبر طبقة overlay فوق البيانات المخزنة.
+
+LOCAL_CACHE_DIR = os.path.join(BASE_DIR, ".cache")
+
+WRITE_BEHIND_ENABLED = False
+WRITE_BEHIND_FLUSH_INTERVAL = 2
+WRITE_BEHIND_MAX_BATCH = 500
+WRITE_BEHIND_MAX_ATTEMPTS = 8
+
+_write_behind_local = threading.local()
+
+def _write_behind_config(key, default):
+    try: return st.secrets.get("write_behind", {}).get(key, default)
+    except Exception: return default
+
+def _write_behind_enabled():
+    return bool(_write_behind_config("enabled", WRITE_BEHIND_ENABLED))
+
+def _write_behind_active():
+    # عامل الخلفية نفسه يكتب مباشرة
+    return _write_behind_enabled() and not getattr(_write_behind_local, "flushing", False)
+
+def _current_session_id():
+    try: return st.session_state.setdefault("_write_session_id", generate_uuid())
+    except Exception: return None
+
+class _WriteBehindQueue:
+    def __init__(self, journal_dir):
+        os.makedirs(journal_dir, exist_ok=True)
+        self.journal_path = os.path.join(journal_dir, "journal.jsonl")
+        self.done_path = os.path.join(journal_dir, "journal.done")
+        self.failed_path = os.path.join(journal_dir, "journal.failed.jsonl")
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        self.pending = []
+        self.seq = 0
+        self.attempts = 0
+        self.last_error = None
+        self.last_flush = None
+        self._replay()
+        threading.Thread(target=self._run, name="write-behind", daemon=True).start()
+
+    def _replay(self):
+        """تحميل العمليات التي لم تُرسل قبل توقف السيرفر"""
+        done = 0
+        if os.path.exists(self.done_path):
+            try:
+                with open(self.done_path) as f: done = int(f.read().strip() or 0)
+            except (OSError, ValueError): done = 0
+        if not os.path.exists(self.journal_path): return
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try: entry = json.loads(line)
+                except ValueError: continue  # سطر غير مكتمل بسبب توقف مفاجئ
+                self.seq = max(self.seq, entry["seq"])
+                if entry["seq"] > done:
+                    # ربما أُرسلت قبل التوقف ولم يُسجل انتهاؤها
+                    entry["retry"] = True
+                    self.pending.append(entry)
+
+    def enqueue(self, op, sheet_name, **args):
+        with self.cond:
+            self.seq += 1
+            entry = {"seq": self.seq, "ts": time.time(), "session": _current_session_id(),
+                     "op": op, "sheet": sheet_name, "args": args}
+            try:
+                with open(self.journal_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError as e:
+                print(f"Write-behind journal error: {e}")
+                self.seq -= 1
+                return False
+            self.pending.append(entry)
+            self.cond.notify()
         return True
-    return False
+
+    def pending_for(self, sheet_name, session_id):
+        with self.lock:
+            return [e for e in self.pending if e["sheet"] == sheet_name and e["session"] == session_id]
+
+    def status(self):
+        with self.lock:
+            return {"pending": len(self.pending), "attempts": self.attempts,
+                    "last_error": self.last_error, "last_flush": self.last_flush}
+
+    def _mark_done(self, group):
+        with self.lock:
+            seqs = {e["seq"] for e in group}
+            self.pending = [e for e in self.pending if e["seq"] not in seqs]
+            if not self.pending:
+                # كل العمليات أُرسلت: نفرغ السجل بدلاً من تركه يكبر
+                open(self.journal_path, "w").close()
+                if os.path.exists(self.done_path): os.remove(self.done_path)
+                return
+            tmp = self.done_path + ".tmp"
+            with open(tmp, "w") as f: f.write(str(max(seqs)))
+            os.replace(tmp, self.done_path)
+
+    def _dead_letter(self, group):
+        with open(self.failed_path, "a", encoding="utf-8") as f:
+            for e in group: f.write(json.dumps(e, ensure_ascii=False, default=str) + "\n")
+        self._mark_done(group)
+
+    def _run(self):
+        _write_behind_local.flushing = True
+        _rate_local.background = True
+        while True:
+            with self.cond:
+                while not self.pending: self.cond.wait()
+            # انتظار قصير لتجميع أكبر عدد من العمليات في دفعة واحدة
+            time.sleep(WRITE_BEHIND_FLUSH_INTERVAL)
+            with self.lock: batch = list(self.pending[:WRITE_BEHIND_MAX_BATCH])
+            for group in _coalesce_mutations(batch):
+                _api_error_local.error, error = None, None
+                try: ok = _apply_mutation_group(group)
+                except Exception as exc: ok, error = False, exc
+                if ok:
+                    self.attempts = 0
+                    self.last_flush = time.time()
+                    self._mark_done(group)
+                    continue
+                error = error or last_api_error()
+                if error is not None: self.last_error = f"{type(error).__name__}: {error}"
+                for e in group: e["retry"] = True
+                if error is not None and not isinstance(error, TransientError):
+                    # خطأ دائم (ورقة أو عمود غير موجود، صلاحية، طلب غير صالح): إعادة المحاولة
+                    # لا تفيد، فتذهب العملية لملف الفشل فوراً ولا تؤخر العمليات التي خلفها
+                    self.attempts = 0
+                    self._dead_letter(group)
+                    continue
+                if isinstance(last_api_error(), ServiceUnavailableError):
+                    # القاطع مفتوح: الانتظار لا يُحسب من محاولات العملية
+                    time.sleep(CIRCUIT_COOLDOWN)
+                    break
+                self.attempts += 1
+                if self.attempts >= WRITE_BEHIND_MAX_ATTEMPTS:
+                    self.attempts = 0
+                    self._dead_letter(group)
+                    continue
+                # فشل مؤقت (حصة API أو انقطاع): ننتظر ثم نعيد المحاولة بنفس الترتيب
+                time.sleep(min(60, 2 ** self.attempts))
+                break
+
+def _coalesce_mutations(entries):
+    """دمج العمليات المتتالية من نفس النوع على نفس الجدول في طلب واحد مع الحفاظ على الترتيب"""
+    groups = []
+    for e in entries:
+        last = groups[-1][-1] if groups else None
+        if (last and last["op"] == e["op"] and last["sheet"] == e["sheet"] and e["op"] != "delete_row"
+                and last["args"].get("id_column") == e["args"].get("id_column")):
+            groups[-1].append(e)
+        else:
+            groups.append([e])
+    return groups
+
+def _sheet_ids(sheet_name):
+    """قيم العمود الأول في الشيت مباشرة (None عند فشل الاتصال)"""
+    client = get_connection()
+    if not client: return None
+    def _ids():
+        try: return {str(v) for v in _get_worksheet(client, sheet_name).col_values(1)[1:]}
+        except WorksheetNotFound: return set()
+    return _execute_with_retry(_ids)
+
+def _apply_mutation_group(group):
+    """تنفيذ مجموعة عمليات مدمجة، يرجع False عند الفشل (ونوعه في last_api_error)"""
+    op, sheet_name, args = group[0]["op"], group[0]["sheet"], group[0]["args"]
+    if op == "add_rows":
+        rows = [r for e in group for r in e["args"]["rows"]]
+        headers = next((e["args"].get("headers") for e in group if e["args"].get("headers")), None)
+        # الإرسال "مرة على الأقل": الدفعة التي ربما وصلت سابقاً لا تُضاف صفوفها
+        # الموجودة في الشيت مرة ثانية (العمود الأول هو المعرف في كل الجداول)
+        if any(e.get("retry") for e in group):
+            present = _sheet_ids(sheet_name)
+            if present is None: return False
+            rows = [r for r in rows if not r or str(r[0]) not in present]
+            if not rows: return True
+        return _add_rows_now(sheet_name, rows, headers) is not None
+    if op == "update_fields":
+        # آخر قيمة لنفس الخلية هي التي تُكتب
+        merged = {}
+        for e in group:
+            for id_value, target_column, new_value in e["args"]["updates"]:
+                merged[(str(id_value), target_column)] = new_value
+        updates = [(i, c, v) for (i, c), v in merged.items()]
+        return _update_fields_now(sheet_name, args["id_column"], updates) is not None
+    if op == "delete_row":
+        return _delete_row_now(sheet_name, args["id_column"], args["id_value"]) is not None
+    return True
+
+@st.cache_resource
+def _get_write_behind():
+    return _WriteBehindQueue(_write_behind_config("journal_dir", os.path.join(LOCAL_CACHE_DIR, "write_behind")))
+
+def get_write_behind_status():
+    """حالة طابور الكتابة المؤجلة (عدد العمليات المعلقة وآخر خطأ)"""
+    if not _write_behind_enabled(): return None
+    return _get_write_behind().status()
+
+def _apply_pending_overlay(df, entries, sheet_name=None):
+    """تطبيق العمليات المعلقة لهذه الجلسة على نسخة من الجدول (read-your-writes)"""
+    df = df.copy()
+    schema = TABLE_SCHEMAS.get(sheet_name, {})
+    for e in entries:
+        op, args = e["op"], e["args"]
+        if op == "add_rows":
+            cols = list(df.columns) if len(df.columns) else list(args.get("headers") or [])
+            if not cols: continue
+            rows = [[str(v) for v in (list(r) + [""] * len(cols))[:len(cols)]] for r in args["rows"]]
+            new = _frame_from_values([cols] + rows, sheet_name)
+            # الصف قد يكون وصل للشيت قبل حذفه من الطابور
+            if len(df): new = new[~new[cols[0]].astype(str).isin(df[cols[0]].astype(str))]
+            df = _concat_typed(df, new) if len(df) else new
+        elif op == "update_fields":
+            col = args["id_column"]
+            if col not in df.columns: continue
+            keys = df[col].astype(str)
+            for id_value, target_column, new_value in args["updates"]:
+                if target_column not in df.columns: continue
+                kind = schema.get(target_column)
+                if kind is not None: new_value = _typed_column(kind, [str(new_value)]).iloc[0]
+                df[target_column] = df[target_column].astype(object)
+                df.loc[keys == str(id_value), target_column] = new_value
+                # إرجاع نوع العمود المعلن بعد التعديل
+                if kind in ('category', 'code'): df[target_column] = df[target_column].astype('category')
+                elif kind is not None: df[target_column] = df[target_column].infer_objects()
+        elif op == "delete_row":
+            col = args["id_column"]
+            if col in df.columns:
+                df = df[df[col].astype(str) != str(args["id_value"])].reset_index(drop=True)
+    return df
 
 # --- دوال التعامل مع Google Drive ---
 
+UPLOAD_CHUNK_SIZE = 5 * 1024 * 1024  # يجب أن يكون من مضاعفات 256KB
+UPLOAD_CONCURRENCY = 3
+UPLOAD_MAX_FAILURES = 5
+
+def _drive_config():
+    try: return st.secrets.get("drive", {})
+    except Exception: return {}
+
+def _upload_chunk_size():
+    mb = _drive_config().get("upload_chunk_mb")
+    if not mb: return UPLOAD_CHUNK_SIZE
+    unit = 256 * 1024
+    return max(unit, int(float(mb) * 1024 * 1024) // unit * unit)
+
+def _upload_to_drive(file_obj, filename, mime_type, folder_id, chunk_size=None, progress=None):
+    """رفع قابل للاستئناف على أجزاء؛ عند انقطاع الاتصال يُستأنف من آخر جزء وصل للسيرفر"""
+    service = _get_drive_service()
+    if service is None: raise RuntimeError("لا يوجد اتصال بـ Google Drive")
+    safe_name = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
+    meta = {'name': safe_name, 'parents': [folder_id]}
+
+    # الصورة موجودة في الذاكرة الآن: نجهز المصغرة قبل الرفع
+    thumb = None
+    if mime_type and mime_type.startswith("image/"):
+        thumb = make_thumbnail(file_obj.read())
+        file_obj.seek(0)
+
+    media = MediaIoBaseUpload(file_obj, mimetype=mime_type, chunksize=chunk_size or _upload_chunk_size(), resumable=True)
+    request = service.files().create(
+        body=meta, 
+        media_body=media, 
+        fields='id, webViewLink',
+        supportsAllDrives=True,
+        supportsTeamDrives=True
+    )
+    response, failures = None, 0
+    while response is None:
+        try:
+            status, response = request.next_chunk()
+            failures = 0
+            if status and progress: progress(status.progress())
+        except (HttpError, OSError, httplib2.HttpLib2Error) as e:
+            if isinstance(e, HttpError) and e.resp.status not in _RETRYABLE_STATUSES: raise
+            failures += 1
+            if failures > UPLOAD_MAX_FAILURES: raise
+            # next_chunk التالية تسأل السيرفر عن آخر بايت وصل وتكمل منه
+            time.sleep(min(2 ** failures, 30))
+    if progress: progress(1.0)
+    if thumb: save_thumbnail(response.get('id'), thumb)
+    return response.get('id'), response.get('webViewLink')
+
+def _upload_error_message(e):
+    error_msg = str(e)
+    return "❌ خطأ: مساحة التخزين ممتلئة." if "storageQuotaExceeded" in error_msg else f"Upload Error: {error_msg}"
+
+@_timed("upload_file_to_cloud")
 def upload_file_to_cloud(file_obj, filename, mime_type):
-    creds = _get_creds_object()
-    if not creds: return None, None
     try:
         fid = st.secrets["google"].get("drive_folder_id")
         if not fid:
             st.error("لم يتم تحديد drive_folder_id في secrets")
             return None, None
-
-        service = build('drive', 'v3', credentials=creds)
-        
-        safe_name = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
-        meta = {'name': safe_name, 'parents': [fid]}
-        
-        media = MediaIoBaseUpload(file_obj, mimetype=mime_type, resumable=True)
-        
-        f = service.files().create(
-            body=meta, 
-            media_body=media, 
-            fields='id, webViewLink',
-            supportsAllDrives=True,
-            supportsTeamDrives=True
-        ).execute()
-        
-        return f.get('id'), f.get('webViewLink')
-        
+        return _upload_to_drive(file_obj, filename, mime_type, fid)
     except Exception as e:
-        error_msg = str(e)
-        if "storageQuotaExceeded" in error_msg:
-             st.error("❌ خطأ: مساحة التخزين ممتلئة.")
-        else:
-             st.error(f"Upload Error: {error_msg}")
+        st.error(_upload_error_message(e))
         return None, None
 
-@st.cache_data(ttl=3600)
-def get_file_content(file_id):
-    creds = _get_creds_object()
-    if not creds: return None
+@st.cache_resource
+def _get_upload_pool():
+    workers = int(_drive_config().get("max_upload_concurrency", UPLOAD_CONCURRENCY))
+    return ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="drive-upload")
+
+@_timed("upload_files_to_cloud")
+def upload_files_to_cloud(files, on_progress=None, chunk_size=None):
+    """رفع عدة ملفات بالتوازي - files: قائمة من (file_obj, filename, mime_type)
+    on_progress(index, fraction) تُستدعى من خيط الصفحة (آمنة لتحديث عناصر Streamlit)
+    يعيد قائمة بنفس الترتيب من (drive_id, web_link, error)"""
+    results = [(None, None, None)] * len(files)
+    fid = st.secrets["google"].get("drive_folder_id")
+    if not fid: return [(None, None, "لم يتم تحديد drive_folder_id في secrets")] * len(files)
+    _get_drive_service()  # تهيئة الاتصال في خيط الصفحة
+    chunk_size = chunk_size or _upload_chunk_size()
+    progress = [0.0] * len(files)
+    pool = _get_upload_pool()
+    futures = {
+        pool.submit(_upload_to_drive, f, name, mtype, fid, chunk_size, lambda p, i=i: progress.__setitem__(i, p)): i
+        for i, (f, name, mtype) in enumerate(files)
+    }
+    pending, shown = set(futures), list(progress)
+    while pending:
+        done, pending = wait(pending, timeout=0.25)
+        for future in done:
+            i = futures[future]
+            try: results[i] = (*future.result(), None)
+            except Exception as e: results[i] = (None, None, _upload_error_message(e))
+        if on_progress:
+            for i, p in enumerate(progress):
+                if p != shown[i]:
+                    shown[i] = p
+                    on_progress(i, p)
+    return results
+
+DOWNLOAD_CHUNK_SIZE = 4 * 1024 * 1024
+
+def _download_file(file_id, fh):
+    """تحميل الملف إلى كائن ملف مفتوح على أجزاء (الذاكرة لا تتجاوز جزءاً واحداً)"""
+    service = _get_drive_service()
+    if service is None: return False
 
     try:
-        service = build('drive', 'v3', credentials=creds)
         request = service.files().get_media(fileId=file_id)
-        
-        file = io.BytesIO()
-        downloader = MediaIoBaseDownload(file, request)
+        downloader = MediaIoBaseDownload(fh, request, chunksize=DOWNLOAD_CHUNK_SIZE)
         
         done = False
         while done is False:
             status, done = downloader.next_chunk()
             
-        return file.getvalue()
+        return True
     except Exception:
+        return False
+
+def _download_range(file_id, start, end):
+    """جزء من الملف بطلب Range (البايتات start..end شاملة)"""
+    service = _get_drive_service()
+    if service is None: return None
+    request = service.files().get_media(fileId=file_id)
+    request.headers["Range"] = f"bytes={start}-{end}"
+    try: return request.execute()
+    except HttpError as e:
+        if e.resp.status == 416: return b""  # بعد نهاية الملف
+        raise
+
+# --- كاش الملفات على القرص (Blob Cache) ---
+# محتوى ملفات Drive يُحفظ على القرص بمفتاح (معرف الملف، md5Checksum/version)
+# بحجم أقصى محدد وإزالة الأقدم استخداماً (LRU)، والقراءة عبر mmap بدلاً من
+# الاحتفاظ بالملفات كاملة في ذاكرة السيرفر داخل st.cache_data
+
+BLOB_CACHE_DIR = os.path.join(LOCAL_CACHE_DIR, "blobs")
+BLOB_CACHE_MAX_BYTES = 512 * 1024 * 1024
+FILE_VERSION_TTL = 600
+
+def _safe_name(value):
+    return re.sub(r'[^A-Za-z0-9_-]', '_', str(value))
+
+class _BlobCache:
+    def __init__(self, directory, max_bytes):
+        self.dir, self.max_bytes = directory, max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # اسم الملف -> الحجم، الأقدم استخداماً أولاً
+        self.total = 0
+        self.versions = {}  # file_id -> (version, وقت التحقق)
+        os.makedirs(directory, exist_ok=True)
+        found = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith(".tmp"):
+                try: os.remove(path)
+                except OSError: pass
+            elif name.endswith(".blob"):
+                info = os.stat(path)
+                found.append((info.st_mtime, name, info.st_size))
+        for _, name, size in sorted(found):
+            self.entries[name] = size
+            self.total += size
+        with self.lock: self._evict()
+
+    @staticmethod
+    def _name(file_id, version):
+        return f"{_safe_name(file_id)}__{_safe_name(version)}.blob"
+
+    def path(self, file_id, version):
+        """مسار الملف المخزن لهذه النسخة (ويُعلَّم كأحدث استخدام) أو None"""
+        name = self._name(file_id, version)
+        path = os.path.join(self.dir, name)
+        with self.lock:
+            if name not in self.entries: return None
+            self.entries.move_to_end(name)
+        try: os.utime(path)
+        except OSError:
+            self._drop(name)
+            return None
+        return path
+
+    def any_path(self, file_id):
+        """أي نسخة مخزنة من الملف (عند تعذر التحقق من النسخة الحالية)"""
+        prefix = f"{_safe_name(file_id)}__"
+        with self.lock:
+            names = [n for n in self.entries if n.startswith(prefix)]
+        return os.path.join(self.dir, names[-1]) if names else None
+
+    def temp_path(self, file_id):
+        """ملف مؤقت داخل مجلد الكاش يُكتب فيه التحميل ثم يُعتمد بـ commit"""
+        return os.path.join(self.dir, f"{_safe_name(file_id)}.{uuid.uuid4().hex}.tmp")
+
+    def put(self, file_id, version, data):
+        tmp = self.temp_path(file_id)
+        try:
+            with open(tmp, "wb") as f: f.write(data)
+        except OSError as e:
+            print(f"Blob cache write error: {e}")
+            return None
+        return self.commit(file_id, version, tmp)
+
+    def commit(self, file_id, version, tmp):
+        name = self._name(file_id, version)
+        path = os.path.join(self.dir, name)
+        try:
+            size = os.path.getsize(tmp)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"Blob cache write error: {e}")
+            return None
+        prefix = f"{_safe_name(file_id)}__"
+        with self.lock:
+            # النسخ القديمة من نفس الملف لم تعد مطلوبة
+            for old in [n for n in self.entries if n.startswith(prefix) and n != name]:
+                self._remove(old)
+            self.total -= self.entries.pop(name, 0)
+            self.entries[name] = size
+            self.total += size
+            self._evict()
+        return path
+
+    def _drop(self, name):
+        with self.lock:
+            self.total -= self.entries.pop(name, 0)
+
+    def _remove(self, name):
+        self.total -= self.entries.pop(name, 0)
+        try: os.remove(os.path.join(self.dir, name))
+        except OSError: pass
+
+    def _evict(self):
+        while self.total > self.max_bytes and len(self.entries) > 1:
+            self._remove(next(iter(self.entries)))
+
+    def stats(self):
+        with self.lock:
+            return {"files": len(self.entries), "bytes": self.total, "max_bytes": self.max_bytes}
+
+@st.cache_resource
+def _get_blob_cache():
+    try: conf = st.secrets.get("blob_cache", {})
+    except Exception: conf = {}
+    max_bytes = int(conf.get("max_mb", BLOB_CACHE_MAX_BYTES // (1024 * 1024))) * 1024 * 1024
+    return _BlobCache(conf.get("dir", BLOB_CACHE_DIR), max_bytes)
+
+def _drive_file_version(file_id):
+    """md5Checksum (أو version لملفات قوقل) مع كاش قصير حتى لا نسأل Drive في كل عرض"""
+    cache = _get_blob_cache()
+    cached = cache.versions.get(file_id)
+    if cached and time.time() - cached[1] < FILE_VERSION_TTL: return cached[0]
+    service = _get_drive_service()
+    if service is None: return None
+    try:
+        request = service.files().get(fileId=file_id, fields="md5Checksum,version", supportsAllDrives=True)
+        meta = _call_api(request.execute, service="drive", deadline=5)
+    except BackendError:
+        return None
+    version = meta.get("md5Checksum") or meta.get("version")
+    if version: cache.versions[file_id] = (version, time.time())
+    return version
+
+def _map_file(path):
+    """قراءة بدون نسخ عبر mmap (يبقى صالحاً حتى بعد حذف الملف من الكاش)"""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0: return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+def _cached_path(file_id):
+    cache = _get_blob_cache()
+    version = _drive_file_version(file_id)
+    return (cache.path(file_id, version) if version else cache.any_path(file_id)), version
+
+def _remove_quietly(path):
+    try: os.remove(path)
+    except OSError: pass
+
+def _fetch_to_cache(file_id, version):
+    """تحميل الملف مباشرة إلى القرص ثم إرجاعه كـ mmap"""
+    if get_circuit_state("drive") == "open": return None
+    cache = _get_blob_cache()
+    tmp = cache.temp_path(file_id)
+    try:
+        with open(tmp, "wb") as f:
+            if not _download_file(file_id, f): return None
+        # بدون نسخة معروفة لا نخزن، لكن القراءة تبقى من القرص لا من الذاكرة
+        path = cache.commit(file_id, version, tmp) if version else tmp
+        return _map_file(path) if path else None
+    except OSError:
+        return None
+    finally:
+        _remove_quietly(tmp)
+
+def open_file_content(file_id):
+    """محتوى ملف Drive ككائن mmap للقراءة (bytes-like) من كاش القرص"""
+    path, version = _cached_path(file_id)
+    if path:
+        try:
+            data = _map_file(path)
+            _get_metrics().incr("blob_cache", "hit")
+            return data
+        except OSError: pass
+    _get_metrics().incr("blob_cache", "miss")
+    return _fetch_to_cache(file_id, version)
+
+@_timed("get_file_content")
+def get_file_content(file_id):
+    data = open_file_content(file_id)
+    if isinstance(data, mmap.mmap):
+        try: return data[:]
+        finally: data.close()
+    return data
+
+def iter_file_content(file_id, start=0, end=None, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """المحتوى أجزاءً (start..end شاملة) بذاكرة محدودة بحجم الجزء.
+    من الكاش إن وُجد، وإلا بطلبات Range متتالية تُكتب في الكاش أثناء المرور
+    (فيبدأ تشغيل الفيديو مثلاً قبل اكتمال التحميل)"""
+    path, version = _cached_path(file_id)
+    if path:
+        try:
+            with open(path, "rb") as f:
+                f.seek(start)
+                remaining = None if end is None else end - start + 1
+                while remaining is None or remaining > 0:
+                    chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                    if not chunk: return
+                    if remaining is not None: remaining -= len(chunk)
+                    yield chunk
+            return
+        except OSError:
+            pass
+
+    # نخزن في الكاش فقط عند المرور على الملف كاملاً من بدايته
+    cache = _get_blob_cache()
+    tmp = cache.temp_path(file_id) if version and start == 0 and end is None else None
+    out = open(tmp, "wb") if tmp else None
+    complete = False
+    try:
+        pos = start
+        while end is None or pos <= end:
+            last = pos + chunk_size - 1 if end is None else min(pos + chunk_size - 1, end)
+            chunk = _download_range(file_id, pos, last)
+            if not chunk: break
+            if out: out.write(chunk)
+            yield chunk
+            pos += len(chunk)
+            if len(chunk) < last - (pos - len(chunk)) + 1: break  # جزء ناقص = نهاية الملف
+        complete = True
+    finally:
+        if out:
+            out.close()
+            if complete: cache.commit(file_id, version, tmp)
+            _remove_quietly(tmp)
+
+def get_file_range(file_id, start, end):
+    """البايتات start..end (شاملة) دون تحميل الملف كاملاً"""
+    return b"".join(iter_file_content(file_id, start, end))
+
+def get_file_path(file_id):
+    """مسار الملف في كاش القرص (يُحمَّل إن لم يكن موجوداً) لتمريره لـ st.image/st.video
+    (تنبيه: Streamlit يقرأ الملف كاملاً في الذاكرة عند عرضه)"""
+    path, version = _cached_path(file_id)
+    if path or not version: return path
+    data = _fetch_to_cache(file_id, version)
+    if isinstance(data, mmap.mmap): data.close()
+    return _get_blob_cache().path(file_id, version)
+
+def get_blob_cache_stats():
+    return _get_blob_cache().stats()
+
+# --- الصور المصغرة (Thumbnails) ---
+# المعرض يعرض نسخة WebP صغيرة محفوظة على القرص بدلاً من الصورة الأصلية،
+# وتُنشأ عند الرفع أو عند أول عرض، والملف الكامل يُجلب فقط عند طلبه
+
+THUMBNAIL_DIR = os.path.join(LOCAL_CACHE_DIR, "thumbnails")
+THUMBNAIL_SIZE = (360, 360)
+THUMBNAIL_QUALITY = 70
+THUMBNAIL_MISS_TTL = 600   # الملف ليس صورة أو تعذر تصغيره
+THUMBNAIL_RETRY_TTL = 60   # تعذر تحميل الملف الأصلي من Drive
+
+def make_thumbnail(data):
+    """تصغير صورة إلى WebP (أو JPEG إذا لم يدعم Pillow صيغة WebP)"""
+    if Image is None or not data: return None
+    try:
+        img = Image.open(io.BytesIO(data))
+        # فك JPEG بدقة مخفضة مباشرة بدلاً من فك الصورة كاملة ثم تصغيرها
+        img.draft("RGB", THUMBNAIL_SIZE)
+        img = ImageOps.exif_transpose(img)
+        img.thumbnail(THUMBNAIL_SIZE)
+        if img.mode not in ("RGB", "RGBA"): img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+        out = io.BytesIO()
+        try:
+            img.save(out, "WEBP", quality=THUMBNAIL_QUALITY, method=4)
+        except (KeyError, OSError):
+            out = io.BytesIO()
+            img.convert("RGB").save(out, "JPEG", quality=THUMBNAIL_QUALITY, optimize=True)
+        return out.getvalue()
+    except Exception as e:
+        print(f"Thumbnail error: {e}")
         return None
 
+def _thumbnail_path(file_id):
+    return os.path.join(THUMBNAIL_DIR, f"{re.sub(r'[^A-Za-z0-9_-]', '_', str(file_id))}.thumb")
+
+def save_thumbnail(file_id, thumb):
+    try:
+        os.makedirs(THUMBNAIL_DIR, exist_ok=True)
+        path = _thumbnail_path(file_id)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f: f.write(thumb)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Thumbnail save error: {e}")
+
+@st.cache_resource
+def _get_thumbnail_misses():
+    """الملفات التي ليس لها صورة مصغرة: file_id -> وقت انتهاء التجاهل"""
+    return {"lock": threading.Lock(), "until": {}}
+
+@_timed("get_thumbnail")
+def get_thumbnail(file_id):
+    """الصورة المصغرة من القرص، أو إنشاؤها من الملف الأصلي عند أول طلب"""
+    path = _thumbnail_path(file_id)
+    try:
+        with open(path, "rb") as f: return f.read()
+    except OSError:
+        pass
+    # لا نعيد تحميل ملف فشل تصغيره في كل إعادة تشغيل للصفحة
+    misses = _get_thumbnail_misses()
+    with misses["lock"]:
+        if misses["until"].get(file_id, 0) > time.time(): return None
+    data = get_file_content(file_id)
+    thumb = make_thumbnail(data)
+    if thumb is None:
+        now = time.time()
+        with misses["lock"]:
+            misses["until"] = {k: t for k, t in misses["until"].items() if t > now}
+            misses["until"][file_id] = now + (THUMBNAIL_MISS_TTL if data else THUMBNAIL_RETRY_TTL)
+        return None
+    save_thumbnail(file_id, thumb)
+    return thumb
+
+# --- التحميل المتوازي (Concurrent Downloads) ---
+# المعرض يطلق كل التحميلات دفعة واحدة عبر مجموعة خيوط محدودة العدد
+# (احتراماً لحصة Drive)، فيصبح زمن الصفحة قريباً من أبطأ ملف لا مجموعها
+
+DOWNLOAD_CONCURRENCY = 6
+
+class _DownloadPool:
+    def __init__(self, workers):
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="drive-download")
+        self.lock = threading.RLock()
+        self.inflight = {}  # (الدالة، file_id) -> Future مشترك بين الجلسات
+
+    def submit(self, fn, file_id):
+        key = (fn.__name__, file_id)
+        with self.lock:
+            future = self.inflight.get(key)
+            if future is None:
+                future = self.executor.submit(fn, file_id)
+                self.inflight[key] = future
+                future.add_done_callback(lambda _, k=key: self._done(k))
+        return future
+
+    def _done(self, key):
+        with self.lock: self.inflight.pop(key, None)
+
+@st.cache_resource
+def _get_download_pool():
+    try: workers = int(st.secrets.get("drive", {}).get("max_concurrency", DOWNLOAD_CONCURRENCY))
+    except Exception: workers = DOWNLOAD_CONCURRENCY
+    return _DownloadPool(max(1, workers))
+
+def fetch_files(file_ids, thumbnails=False):
+    """تحميل متوازٍ لعدة ملفات؛ يعيد (file_id, data) بترتيب انتهاء كل تحميل"""
+    fn = get_thumbnail if thumbnails else get_file_content
+    pool = _get_download_pool()
+    _get_blob_cache()  # تهيئة الكاش في خيط الصفحة قبل الخيوط العاملة
+    futures = {pool.submit(fn, fid): fid for fid in dict.fromkeys(file_ids) if fid}
+    for future in as_completed(futures):
+        try: data = future.result()
+        except Exception as e:
+            print(f"Download error ({futures[future]}): {e}")
+            data = None
+        yield futures[future], data
+
+def fetch_thumbnails(file_ids):
+    return fetch_files(file_ids, thumbnails=True)
+
 def generate_uuid(): return str(uuid.uuid4())
 
 # ==========================================
 # 3. الموديلات (Models)
 # ==========================================
 
-class UserModel:
+class _Record:
+    """أساس الموديلات: الخصائص في __slots__ بدلاً من قاموس لكل كائن (ذاكرة أقل وإنشاء أسرع)"""
+    __slots__ = ()
+    def to_dict(self): return {k: getattr(self, k) for k in self.__slots__}
+
+def _hydrate(df, cls, columns):
+    """بناء الكائنات من أعمدة الجدول مباشرة بدلاً من iterrows الذي ينشئ Series لكل صف"""
+    if df.empty: return []
+    return [cls(*values) for values in zip(*(_format_dates(df[c]).tolist() for c in columns))]
+
+class UserModel(_Record):
+    __slots__ = ('user_id', 'name', 'email', 'role_id', 'status', 'created_at', 'role_name')
+    _COLUMNS = ('user_id', 'name', 'email', 'role_id', 'status', 'created_at')
     def __init__(self, uid, name, email, rid, status, created):
         self.user_id, self.name, self.email = uid, name, email
         self.role_id, self.status, self.created_at = int(rid), status, created
         self.role_name = ROLE_NAMES.get(self.role_id, "Unknown")
     @staticmethod
     def get_all_users():
-        df = get_data(TABLE_USERS)
-        return [UserModel(r['user_id'], r['name'], r['email'], r['role_id'], r['status'], r['created_at']) for _, r in df.iterrows()] if not df.empty else []
+        return list(_get_derived("users", [TABLE_USERS], lambda df: _hydrate(df, UserModel, UserModel._COLUMNS)))
     @staticmethod
     def get_user_by_email(email):
         df = get_data(TABLE_USERS)
         if df.empty: return None, None
         row = df[df['email'] == email]
         if not row.empty:
-            r = row.iloc[0]
-            return UserModel(r['user_id'], r['name'], r['email'], r['role_id'], r['status'], r['created_at']), r['password_hash']
+            return _hydrate(row.head(1), UserModel, UserModel._COLUMNS)[0], row['password_hash'].iloc[0]
         return None, None
     @staticmethod
     def create_user(name, email, password, role_id):
@@ -285,54 +2166,81 @@ class UserModel:
         headers = ['user_id', 'name', 'email', 'password_hash', 'role_id', 'status', 'created_at']
         if add_row(TABLE_USERS, [generate_uuid(), name, email, phash, role_id, STATUS_ACTIVE, datetime.now().strftime("%Y-%m-%d")], new_sheet_headers=headers):
             return True, "تم"
-        return False, "فشل"
+        err = last_api_error()
+        return False, err.message if err else "فشل"
     @staticmethod
     def update_user_status(uid, st): return update_field(TABLE_USERS, "user_id", uid, "status", st)
     @staticmethod
     def delete_user(uid): return delete_row(TABLE_USERS, "user_id", uid)
 
-class SectionModel:
-    def __init__(self, sid, name, public): self.section_id, self.name, self.is_public = sid, name, str(public).lower()=='true'
+# --- فهرس الهيكل: الأقسام ← الأقسام الفرعية ← التصنيفات ← المحتوى ---
+# كل مستوى يُجمّع مرة واحدة لكل نسخة من جدوله في قاموس (المعرف الأب -> قائمة مرتبة)
+# بدلاً من فلترة الجدول كاملاً في كل استدعاء داخل الحلقات المتداخلة
+
+def _group_records(df, key_column, cls, sort=False):
+    """قاموس: قيمة المفتاح -> قائمة كائنات، مرتبة حسب sort_order إذا طُلب"""
+    groups = {}
+    if df.empty or key_column not in df.columns: return groups
+    items = list(zip(df[key_column].astype(str).tolist(), _hydrate(df, cls, cls._COLUMNS)))
+    if sort and 'sort_order' in df.columns:
+        order = [_sort_key(v) for v in df['sort_order'].tolist()]
+        items = [items[i] for i in sorted(range(len(items)), key=order.__getitem__)]
+    for key, obj in items:
+        groups.setdefault(key, []).append(obj)
+    return groups
+
+class SectionModel(_Record):
+    __slots__ = ('section_id', 'name', 'is_public')
+    _COLUMNS = ('section_id', 'name', 'is_public')
+    def __init__(self, sid, name, public): self.section_id, self.name, self.is_public = sid, name, bool(public)
     @staticmethod
     def get_all_sections():
-        df = get_data(TABLE_SECTIONS)
-        return [SectionModel(r['section_id'], r['name'], r['is_public']) for _, r in df.sort_values('sort_order').iterrows()] if not df.empty else []
+        def _build(df):
+            if df.empty: return []
+            return _hydrate(df.sort_values('sort_order'), SectionModel, SectionModel._COLUMNS)
+        return list(_get_derived("sections", [TABLE_SECTIONS], _build))
     @staticmethod
     def create_section(name, by, pub): 
         headers = ['section_id', 'name', 'created_by', 'created_at', 'sort_order', 'is_public']
         add_row(TABLE_SECTIONS, [generate_uuid(), name, by, datetime.now().strftime("%Y-%m-%d"), 99, str(pub)], new_sheet_headers=headers)
 
-class TabModel:
+class TabModel(_Record):
+    __slots__ = ('tab_id', 'section_id', 'name')
+    _COLUMNS = __slots__
     def __init__(self, tid, sid, name): self.tab_id, self.section_id, self.name = tid, sid, name
     @staticmethod
     def get_tabs_by_section(sid):
-        df = get_data(TABLE_TABS)
-        return [TabModel(r['tab_id'], r['section_id'], r['name']) for _, r in df[df['section_id']==str(sid)].iterrows()] if not df.empty else []
+        index = _get_derived("tabs_by_section", [TABLE_TABS], lambda df: _group_records(df, 'section_id', TabModel, sort=True))
+        return list(index.get(str(sid), []))
     @staticmethod
     def create_tab(sid, name, by): 
         headers = ['tab_id', 'section_id', 'name', 'created_by', 'created_at', 'sort_order']
         add_row(TABLE_TABS, [generate_uuid(), sid, name, by, datetime.now().strftime("%Y-%m-%d"), 99], new_sheet_headers=headers)
 
-class CategoryModel:
+class CategoryModel(_Record):
+    __slots__ = ('category_id', 'tab_id', 'name')
+    _COLUMNS = __slots__
     def __init__(self, cid, tid, name): self.category_id, self.tab_id, self.name = cid, tid, name
     @staticmethod
     def get_categories_by_tab(tid):
-        df = get_data(TABLE_CATEGORIES)
-        return [CategoryModel(r['category_id'], r['tab_id'], r['name']) for _, r in df[df['tab_id']==str(tid)].iterrows()] if not df.empty else []
+        index = _get_derived("categories_by_tab", [TABLE_CATEGORIES], lambda df: _group_records(df, 'tab_id', CategoryModel, sort=True))
+        return list(index.get(str(tid), []))
     @staticmethod
     def create_category(tid, name, by): 
         headers = ['category_id', 'tab_id', 'name', 'created_by', 'created_at', 'sort_order']
         add_row(TABLE_CATEGORIES, [generate_uuid(), tid, name, by, datetime.now().strftime("%Y-%m-%d"), 99], new_sheet_headers=headers)
 
-class ContentModel:
+class ContentModel(_Record):
+    __slots__ = ('content_id', 'category_id', 'title', 'body', 'social_link', 'content_type', 'created_by', 'created_at')
+    _COLUMNS = __slots__
     def __init__(self, cid, catid, title, body, link, ctype, by, at):
         self.content_id, self.category_id, self.title = cid, catid, title
         self.body, self.social_link, self.content_type = body, link, ctype
         self.created_by, self.created_at = by, at
     @staticmethod
     def get_content_by_category(catid):
-        df = get_data(TABLE_CONTENT)
-        return [ContentModel(r['content_id'], r['category_id'], r['title'], r['body'], r['social_link'], r['content_type'], r['created_by'], r['created_at']) for _, r in df[df['category_id']==str(catid)].iterrows()] if not df.empty else []
+        index = _get_derived("content_by_category", [TABLE_CONTENT], lambda df: _group_records(df, 'category_id', ContentModel))
+        return list(index.get(str(catid), []))
     @staticmethod
     def create_content(cat_id, ctype, title, body, social_link, created_by):
         headers = ['content_id', 'category_id', 'content_type', 'title', 'body', 'file_url', 'social_link', 'thumbnail', 'created_by', 'created_at']
@@ -340,35 +2248,184 @@ class ContentModel:
     @staticmethod
     def delete_content(cid): return delete_row(TABLE_CONTENT, "content_id", cid)
 
-class PermissionModel:
+class PermissionModel(_Record):
+    __slots__ = ('permission_id', 'user_id', 'section_id', 'tab_id', 'view', 'edit', 'hidden')
+    _COLUMNS = __slots__
     def __init__(self, pid, uid, sid, tid, view, edit, hidden):
         self.permission_id, self.user_id, self.section_id, self.tab_id = pid, uid, str(sid), str(tid)
-        self.view, self.edit, self.hidden = str(view).lower()=='true', str(edit).lower()=='true', str(hidden).lower()=='true'
+        self.view, self.edit, self.hidden = bool(view), bool(edit), bool(hidden)
     @staticmethod
     def get_permissions_by_user(uid):
         df = get_data(TABLE_PERMISSIONS)
-        return [PermissionModel(r['permission_id'], r['user_id'], r['section_id'], r['tab_id'], r['view'], r['edit'], r['hidden']) for _, r in df[df['user_id']==str(uid)].iterrows()] if not df.empty else []
+        return _hydrate(df[df['user_id']==str(uid)], PermissionModel, PermissionModel._COLUMNS) if not df.empty else []
     @staticmethod
     def grant_permission(uid, sid="", tid="", cid="", view=True, edit=False, hidden=False):
+        return PermissionModel.grant_permissions(uid, [dict(sid=sid, tid=tid, cid=cid, view=view, edit=edit, hidden=hidden)])
+    @staticmethod
+    def grant_permissions(uid, grants):
+        """منح عدة صلاحيات دفعة واحدة (upsert): الصف الموجود لنفس
+        (user_id, section_id, tab_id, content_id) يُعدّل، والجديد يُضاف
+        grants: قائمة من dict بالمفاتيح sid, tid, cid, view, edit, hidden"""
         headers = ['permission_id', 'user_id', 'section_id', 'tab_id', 'content_id', 'view', 'edit', 'hidden']
-        add_row(TABLE_PERMISSIONS, [generate_uuid(), uid, str(sid), str(tid), str(cid), str(view), str(edit), str(hidden)], new_sheet_headers=headers)
+        existing = _get_permission_state()["rows"]
+        wanted = {}
+        for g in grants:
+            key = (str(uid), str(g.get('sid', "")), str(g.get('tid', "")), str(g.get('cid', "")))
+            wanted[key] = PermissionGrant(bool(g.get('view', True)), bool(g.get('edit', False)), bool(g.get('hidden', False)))
+
+        updates, new_keys = [], []
+        for key, grant in wanted.items():
+            if key not in existing:
+                new_keys.append(key)
+                continue
+            pid, current = existing[key]
+            # لا حاجة للكتابة إذا لم تتغير الصلاحية
+            if current == grant: continue
+            updates += [(pid, col, str(val)) for col, val in zip(PermissionGrant._fields, grant)]
+
+        ok = True
+        if updates:
+            missing = update_fields(TABLE_PERMISSIONS, "permission_id", updates)
+            if missing is None: ok = False
+            else: new_keys += [k for k in wanted if k in existing and existing[k][0] in missing]
+        if new_keys:
+            rows = [[generate_uuid(), *k, *(str(v) for v in wanted[k])] for k in new_keys]
+            ok = add_rows(TABLE_PERMISSIONS, rows, new_sheet_headers=headers) and ok
+        return ok
+    @staticmethod
+    def get_table_stats():
+        """عدد صفوف جدول الصلاحيات وعدد الصفوف المكررة التي يمكن ضغطها"""
+        state = _get_permission_state()
+        return {"rows": state["total"], "unique": len(state["rows"]), "duplicates": state["total"] - len(state["rows"])}
+    @staticmethod
+    def compact():
+        """دمج الصفوف المكررة في آخر صلاحية لكل مفتاح بطلب batch_update واحد"""
+        return compact_permissions()
     @staticmethod
-    def check_access(uid, section_id=None):
-        perms = PermissionModel.get_permissions_by_user(uid)
-        for p in perms:
-            if p.section_id == str(section_id) and not p.tab_id:
-                if p.hidden: return False, False
-                if p.view or p.edit: return True, p.edit
-        return False, False
+    def get_user_matrix(uid):
+        """صلاحيات المستخدم المجمعة: (section_id, tab_id) -> PermissionGrant"""
+        return _get_permission_state()["matrix"].get(str(uid), {})
+    @staticmethod
+    def check_access(uid, section_id=None, tab_id=None):
+        """(عرض، تعديل) للمستخدم، وصلاحية التبويب ترث من القسم إذا لم تُحدد"""
+        grants = PermissionModel.get_user_matrix(uid)
+        sec = grants.get((str(section_id), ""))
+        if sec is not None and sec.hidden: return False, False
+        perm = grants.get((str(section_id), str(tab_id))) if tab_id else None
+        if perm is None or not any(perm): perm = sec
+        if perm is None or perm.hidden: return False, False
+        return perm.view or perm.edit, perm.edit
+
+# --- مصفوفة الصلاحيات المجمعة (Permission Matrix) ---
+# تُبنى مرة لكل نسخة من جدول الصلاحيات، والصف الأحدث في الشيت هو الذي يُعتمد
+
+PermissionGrant = namedtuple("PermissionGrant", ["view", "edit", "hidden"])
+
+PERMISSIONS_COMPACT_RATIO = 2
+PERMISSIONS_COMPACT_INTERVAL = 3600
+
+def _grant_from_record(r):
+    return PermissionGrant(bool(r['view']), bool(r['edit']), bool(r['hidden']))
+
+def _build_permission_state(df):
+    """matrix: user_id -> {(section_id, tab_id): PermissionGrant}
+    rows: (user_id, section_id, tab_id, content_id) -> (permission_id, PermissionGrant) لآخر صف"""
+    matrix, rows = {}, {}
+    if df.empty or 'user_id' not in df.columns: return {"matrix": matrix, "rows": rows, "total": 0}
+    has_content = 'content_id' in df.columns
+    for r in df.to_dict('records'):
+        cid = str(r['content_id']).strip() if has_content else ""
+        grant = _grant_from_record(r)
+        rows[(str(r['user_id']), str(r['section_id']), str(r['tab_id']), cid)] = (str(r['permission_id']), grant)
+        # صلاحيات مستوى المحتوى غير مستخدمة في المصفوفة
+        if cid: continue
+        matrix.setdefault(str(r['user_id']), {})[(str(r['section_id']), str(r['tab_id']))] = grant
+    return {"matrix": matrix, "rows": rows, "total": len(df)}
+
+def _get_permission_state():
+    state = _get_derived("permissions", [TABLE_PERMISSIONS], _build_permission_state)
+    # الجدول تضخم بالصفوف المكررة من الإصدارات السابقة: ضغطه في الخلفية
+    if state["rows"] and state["total"] >= PERMISSIONS_COMPACT_RATIO * len(state["rows"]):
+        _schedule_permissions_compaction()
+    return state
+
+@st.cache_resource
+def _get_compaction_state():
+    """قفل ووقت آخر ضغط تلقائي لجدول الصلاحيات على مستوى العملية"""
+    return {"lock": threading.Lock(), "last": 0.0}
 
-class ChecklistModel:
+def _schedule_permissions_compaction():
+    state = _get_compaction_state()
+    if time.time() - state["last"] < PERMISSIONS_COMPACT_INTERVAL: return
+    if not state["lock"].acquire(blocking=False): return
+    state["last"] = time.time()
+    def _job():
+        try:
+            with background_priority(): compact_permissions()
+        except Exception as e: print(f"Permissions compaction error: {e}")
+        finally: state["lock"].release()
+    threading.Thread(target=_job, name="permissions-compaction", daemon=True).start()
+
+def _cell_data(value):
+    if isinstance(value, bool): return {"userEnteredValue": {"boolValue": value}}
+    if isinstance(value, (int, float)): return {"userEnteredValue": {"numberValue": value}}
+    return {"userEnteredValue": {"stringValue": str(value)}}
+
+def compact_permissions():
+    """إعادة كتابة جدول الصلاحيات بآخر صف لكل (user_id, section_id, tab_id, content_id)
+    يقرأ الجدول من الشيت مباشرة ثم يكتبه ويحذف الصفوف الزائدة في طلب batch_update واحد.
+    يرجع عدد الصفوف المحذوفة أو None عند الفشل"""
+    client = get_connection()
+    if not client: return None
+    def _compact():
+        ws = _get_worksheet(client, TABLE_PERMISSIONS)
+        # الكتابة بالمواقع: لا تُسمح إضافة أو تعديل أو حذف على الجدول حتى ينتهي الضغط
+        with _get_table_cache().write_lock(TABLE_PERMISSIONS):
+            return _compact_locked(ws)
+    def _compact_locked(ws):
+        values = ws.get_all_values(value_render_option="UNFORMATTED_VALUE")
+        if len(values) < 2: return 0
+        headers = values[0]
+        key_cols = [headers.index(c) for c in ('user_id', 'section_id', 'tab_id', 'content_id') if c in headers]
+        latest = {}
+        for row in values[1:]:
+            row = (row + [""] * len(headers))[:len(headers)]
+            key = tuple(str(row[i]) for i in key_cols)
+            latest.pop(key, None)
+            latest[key] = row
+        kept = list(latest.values())
+        removed = len(values) - 1 - len(kept)
+        if removed == 0: return 0
+        # كتابة من عملية أخرى (أو تعديل مباشر في الشيت) أثناء القراءة: نلغي ونعيد الضغط لاحقاً
+        first = [r[0] if r else "" for r in values]
+        while first and first[-1] == "": first.pop()
+        if ws.col_values(1, value_render_option="UNFORMATTED_VALUE") != first: return None
+        sh = _get_spreadsheet(client)
+        sh.batch_update({"requests": [
+            {"updateCells": {
+                "range": {"sheetId": ws.id, "startRowIndex": 1, "endRowIndex": 1 + len(kept),
+                          "startColumnIndex": 0, "endColumnIndex": len(headers)},
+                "rows": [{"values": [_cell_data(v) for v in row]} for row in kept],
+                "fields": "userEnteredValue"}},
+            {"deleteDimension": {"range": {"sheetId": ws.id, "dimension": "ROWS",
+                                           "startIndex": 1 + len(kept), "endIndex": len(values)}}},
+        ]})
+        # مواقع الصفوف تغيرت بالكامل: الفهرس يُلغى قبل تحرير القفل
+        _drop_row_indexes(TABLE_PERMISSIONS)
+        invalidate_table(TABLE_PERMISSIONS)
+        return removed
+
+    return _execute_with_retry(_compact)
+
+class ChecklistModel(_Record):
+    __slots__ = ('item_id', 'main_title', 'sub_title', 'item_name', 'is_checked', 'created_by')
+    _COLUMNS = __slots__
     def __init__(self, iid, main, sub, name, checked, by):
         self.item_id, self.main_title, self.sub_title, self.item_name = iid, main, sub, name
-        self.is_checked, self.created_by = str(checked).upper()=='TRUE', by
+        self.is_checked, self.created_by = bool(checked), by
     @staticmethod
     def get_all_items():
-        df = get_data(TABLE_CHECKLISTS)
-        return [ChecklistModel(r['item_id'], r['main_title'], r['sub_title'], r['item_name'], r['is_checked'], r['created_by']) for _, r in df.iterrows()] if not df.empty else []
+        return list(_get_derived("checklists", [TABLE_CHECKLISTS], lambda df: _hydrate(df, ChecklistModel, ChecklistModel._COLUMNS)))
     @staticmethod
     def add_item(main, sub, name, by): 
         headers = ['item_id', 'main_title', 'sub_title', 'item_name', 'is_checked', 'created_by']
@@ -377,34 +2434,73 @@ class ChecklistModel:
     def toggle_status(iid, curr): update_field(TABLE_CHECKLISTS, "item_id", iid, "is_checked", "FALSE" if curr else "TRUE")
     @staticmethod
     def delete_item(iid): delete_row(TABLE_CHECKLISTS, "item_id", iid)
+    @staticmethod
+    def add_items(items, by):
+        """إضافة عدة بنود دفعة واحدة - items: قائمة من (main, sub, name)"""
+        headers = ['item_id', 'main_title', 'sub_title', 'item_name', 'is_checked', 'created_by']
+        return add_rows(TABLE_CHECKLISTS, [[generate_uuid(), main, sub, name, "FALSE", by] for main, sub, name in items], new_sheet_headers=headers)
+    @staticmethod
+    def set_statuses(statuses):
+        """تعديل حالة عدة بنود دفعة واحدة - statuses: {item_id: True/False}"""
+        return update_fields(TABLE_CHECKLISTS, "item_id", [(iid, "is_checked", "TRUE" if v else "FALSE") for iid, v in statuses.items()]) is not None
 
-class MediaModel:
+class MediaModel(_Record):
+    __slots__ = ('media_id', 'file_name', 'file_type', 'google_drive_id', 'uploaded_by', 'uploaded_at')
+    _COLUMNS = __slots__
     def __init__(self, mid, name, mtype, did, by, at):
         self.media_id, self.file_name, self.file_type = mid, name, mtype
         self.google_drive_id, self.uploaded_by, self.uploaded_at = did, by, at
     @staticmethod
     def get_all_media():
-        df = get_data(TABLE_MEDIA)
-        return [MediaModel(r['media_id'], r['file_name'], r['file_type'], r['google_drive_id'], r['uploaded_by'], r['uploaded_at']) for _, r in df.iterrows()] if not df.empty else []
+        return list(_get_derived("media", [TABLE_MEDIA], lambda df: _hydrate(df, MediaModel, MediaModel._COLUMNS)))
     @staticmethod
     def add_media(name, mtype, drive_id, by):
+        return MediaModel.add_media_batch([(name, mtype, drive_id)], by)
+    @staticmethod
+    def add_media_batch(items, by):
+        """تسجيل عدة ملفات بكتابة واحدة - items: قائمة من (name, mtype, drive_id)"""
         headers = ['media_id', 'file_name', 'file_type', 'google_drive_id', 'uploaded_by', 'uploaded_at']
-        add_row(TABLE_MEDIA, [generate_uuid(), name, mtype, drive_id, by, datetime.now().strftime("%Y-%m-%d")], new_sheet_headers=headers)
+        at = datetime.now().strftime("%Y-%m-%d")
+        return add_rows(TABLE_MEDIA, [[generate_uuid(), name, mtype, did, by, at] for name, mtype, did in items], new_sheet_headers=headers)
 
-class SettingModel:
+class SettingModel(_Record):
+    __slots__ = ('key', 'value')
+    _COLUMNS = ('setting_key', 'setting_value')
+    _HEADERS = ['setting_key', 'setting_value', 'description', 'updated_by', 'updated_at']
     def __init__(self, key, val): self.key, self.value = key, val
     @staticmethod
     def get_all_settings():
         df = get_data(TABLE_SETTINGS)
-        return {r['setting_key']: SettingModel(r['setting_key'], r['setting_value']) for _, r in df.iterrows()} if not df.empty else {}
+        return {m.key: m for m in _hydrate(df, SettingModel, SettingModel._COLUMNS)}
     @staticmethod
     def update_setting(key, val, user):
         update_field(TABLE_SETTINGS, "setting_key", key, "setting_value", str(val))
     @staticmethod
+    def update_settings(values, user):
+        """حفظ عدة إعدادات بطلب واحد، والمفاتيح غير الموجودة تُضاف كصفوف جديدة.
+        الصفوف والأعمدة المعدلة تتبع صف العناوين الفعلي في الشيت"""
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # الورقة غير موجودة (أو فارغة): تُنشأ بالعناوين الافتراضية
+        columns = list(get_data(TABLE_SETTINGS).columns) or SettingModel._HEADERS
+        fields = {"updated_by": user, "updated_at": now}
+        updates = []
+        for key, val in values.items():
+            row = dict(fields, setting_value=str(val))
+            updates += [(key, col, v) for col, v in row.items() if col in columns]
+        missing = update_fields(TABLE_SETTINGS, "setting_key", updates)
+        if missing is None: return False
+        if missing:
+            rows = [[dict(fields, setting_key=k, setting_value=str(values[k])).get(c, "") for c in columns]
+                    for k in values if k in missing]
+            return add_rows(TABLE_SETTINGS, rows, new_sheet_headers=columns)
+        return True
+    @staticmethod
     def initialize_defaults(user):
         curr = SettingModel.get_all_settings()
-        if "site_title" not in curr: 
-            add_row(TABLE_SETTINGS, ["site_title", "المنصة", "", user, ""], new_sheet_headers=['setting_key', 'setting_value', 'description', 'updated_by', 'updated_at'])
+        if "site_title" not in curr:
+            columns = list(get_data(TABLE_SETTINGS).columns) or SettingModel._HEADERS
+            row = {"setting_key": "site_title", "setting_value": "المنصة", "updated_by": user}
+            add_row(TABLE_SETTINGS, [row.get(c, "") for c in columns], new_sheet_headers=columns)
 
 # ==========================================
 # 4. موديل التعليقات
@@ -422,20 +2518,35 @@ class CommentModel:
         ], new_sheet_headers=headers)
 
     @staticmethod
-    def get_comments_by_content(content_id):
-        df = get_data(TABLE_COMMENTS)
-        if df.empty: return []
-        
-        required_cols = ['content_id', 'user_name', 'comment_text', 'created_at']
-        if not all(col in df.columns for col in required_cols):
-            return []
+    def _index():
+        """فهرس التعليقات: content_id -> قائمة مرتبة من الأحدث للأقدم (يُبنى مرة لكل نسخة من الجدول)"""
+        def _build(df):
+            required_cols = ['content_id', 'user_name', 'comment_text', 'created_at']
+            if df.empty or not all(col in df.columns for col in required_cols): return {}
+            df = df.sort_values('created_at', ascending=False, kind='stable', na_position='last')
+            records = df.assign(created_at=_format_dates(df['created_at'])).to_dict('records')
+            index = {}
+            for r in records: index.setdefault(str(r['content_id']), []).append(r)
+            return index
+        return _get_derived("comments_by_content", [TABLE_COMMENTS], _build)
 
-        filtered_df = df[df['content_id'].astype(str) == str(content_id)]
-        
-        if not filtered_df.empty and 'created_at' in filtered_df.columns:
-            filtered_df = filtered_df.sort_values('created_at')
-            
-        return filtered_df.to_dict('records')
+    @staticmethod
+    def get_comment_count(content_id):
+        return len(CommentModel._index().get(str(content_id), []))
+
+    @staticmethod
+    def get_comments_page(content_id, page_size=10, cursor=0):
+        """صفحة من التعليقات (الأحدث أولاً)، ترجع (التعليقات، المؤشر التالي أو None)"""
+        comments = CommentModel._index().get(str(content_id), [])
+        cursor = int(cursor or 0)
+        page = comments[cursor:cursor + page_size]
+        next_cursor = cursor + page_size if cursor + page_size < len(comments) else None
+        return [dict(c) for c in page], next_cursor
+
+    @staticmethod
+    def get_comments_by_content(content_id):
+        """كل تعليقات المحتوى من الأقدم للأحدث"""
+        return [dict(c) for c in reversed(CommentModel._index().get(str(content_id), []))]
 
     @staticmethod
     def delete_comment(comment_id):
@@ -458,6 +2569,7 @@ def login_procedure(email, password):
         st.session_state['logged_in'] = True
         st.session_state['user'] = user
         return True, "تم الدخول"
+    if not user and get_circuit_state("sheets") != "closed": return False, ServiceUnavailableError.message
     return False, "بيانات خاطئة"
 
 def logout_procedure():
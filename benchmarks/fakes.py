@@ -0,0 +1,386 @@
+"""بديل داخل الذاكرة لـ gspread و Google Drive لتشغيل backend.py بدون حساب قوقل
+
+يغطي ما يستخدمه backend فقط: open_by_key و worksheet و get_all_values و cell و
+append_row(s) و find و update_cell و batch_update و delete_rows و values_batch_get (مع النطاقات)
+و files().create/get/get_media، مع تأخير وأخطاء (429 و 5xx) قابلة للضبط.
+
+    from fakes import Faults, bk, install
+    client, drive = install({"users": [["user_id", "name"], ["u1", "أحمد"]]}, Faults(latency=0.05, rate_429=0.02))
+    bk.UserModel.get_all_users()
+"""
+import hashlib
+import io
+import os
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+from gspread.exceptions import APIError, WorksheetNotFound
+from gspread.utils import a1_to_rowcol
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaUploadProgress
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import backend as bk  # noqa: E402
+import streamlit.logger  # noqa: E402
+
+# تشغيل خارج streamlit run: إخفاء تحذيرات "missing ScriptRunContext"
+streamlit.logger.set_log_level("error")
+
+
+class Faults:
+    """تأخير لكل طلب (بالثواني، مع تذبذب) ونسبة أخطاء 429 و 5xx"""
+    def __init__(self, latency=0.0, jitter=0.0, rate_429=0.0, rate_5xx=0.0, seed=0):
+        self.latency, self.jitter = latency, jitter
+        self.rate_429, self.rate_5xx = rate_429, rate_5xx
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def hit(self, service, op):
+        with self.lock:
+            self.calls[(service, op)] = self.calls.get((service, op), 0) + 1
+            roll = self.random.random()
+            delay = self.latency + self.random.uniform(0, self.jitter) if self.latency or self.jitter else 0
+        if delay: time.sleep(delay)
+        if roll < self.rate_429: return 429
+        if roll < self.rate_429 + self.rate_5xx: return 503
+        return None
+
+    def total(self, service=None):
+        with self.lock:
+            return sum(n for (s, _), n in self.calls.items() if service is None or s == service)
+
+    def reset(self):
+        with self.lock: self.calls = {}
+
+
+def _api_error(status):
+    response = requests.Response()
+    response.status_code = status
+    response._content = ('{"error": {"code": %d, "message": "injected fault", "status": "%s"}}'
+                         % (status, "RESOURCE_EXHAUSTED" if status == 429 else "UNAVAILABLE")).encode()
+    return APIError(response)
+
+
+class _Response(dict):
+    def __init__(self, status, headers=None):
+        super().__init__(headers or {})
+        self.status = status
+        self.reason = "injected fault" if status >= 400 else "OK"
+
+
+def _http_error(status):
+    return HttpError(_Response(status), b'{"error": {"message": "injected fault"}}')
+
+
+# --------------------------------------------------------------------------
+# Sheets
+# --------------------------------------------------------------------------
+
+class Cell:
+    def __init__(self, row, col, value):
+        self.row, self.col, self.value = row, col, value
+
+
+def _slice(rows, a1):
+    """قيم نطاق مثل A5:J أو 1:1 (بدون نطاق: الورقة كاملة) مع حذف الصفوف الفارغة في النهاية"""
+    if not a1: return [list(x) for x in rows]
+    m = re.fullmatch(r"([A-Z]*)(\d*):([A-Z]*)(\d*)", a1)
+    col = lambda letters, default: a1_to_rowcol(letters + "1")[1] if letters else default
+    r0, r1 = int(m.group(2) or 1), int(m.group(4) or len(rows))
+    c0, c1 = col(m.group(1), 1), col(m.group(3), None)
+    out = [list(r[c0 - 1:c1]) for r in rows[r0 - 1:r1]]
+    while out and not any(out[-1]): out.pop()
+    return out
+
+
+class FakeWorksheet:
+    def __init__(self, spreadsheet, title, rows, sheet_id):
+        self.spreadsheet, self.title, self.id = spreadsheet, title, sheet_id
+        self.rows = [[str(v) for v in r] for r in rows]
+
+    def _call(self, op, write=False):
+        status = self.spreadsheet.faults.hit("sheets_write" if write else "sheets_read", op)
+        if status: raise _api_error(status)
+        if write: self.spreadsheet.touch()
+
+    def get_all_records(self, **kwargs):
+        self._call("get_all_records")
+        if not self.rows: return []
+        headers = self.rows[0]
+        return [dict(zip(headers, r + [""] * (len(headers) - len(r)))) for r in self.rows[1:]]
+
+    def get_all_values(self, **kwargs):
+        self._call("get_all_values")
+        return [list(r) for r in self.rows]
+
+    def row_values(self, row, **kwargs):
+        self._call("row_values")
+        return list(self.rows[row - 1]) if row <= len(self.rows) else []
+
+    def col_values(self, col, **kwargs):
+        self._call("col_values")
+        values = [r[col - 1] if len(r) >= col else "" for r in self.rows]
+        while values and values[-1] == "": values.pop()
+        return values
+
+    def _appended(self, first, last):
+        return {"updates": {"updatedRange": f"'{self.title}'!A{first}:Z{last}"}}
+
+    def append_row(self, values, **kwargs):
+        self._call("append_row", write=True)
+        self.rows.append([str(v) for v in values])
+        return self._appended(len(self.rows), len(self.rows))
+
+    def append_rows(self, values, **kwargs):
+        self._call("append_rows", write=True)
+        first = len(self.rows) + 1
+        self.rows.extend([str(v) for v in r] for r in values)
+        return self._appended(first, len(self.rows))
+
+    def cell(self, row, col, **kwargs):
+        self._call("cell")
+        r = self.rows[row - 1] if row <= len(self.rows) else []
+        return Cell(row, col, r[col - 1] if col <= len(r) else "")
+
+    def find(self, query, in_column=None, **kwargs):
+        self._call("find")
+        for i, r in enumerate(self.rows):
+            for j, v in enumerate(r):
+                if in_column and j + 1 != in_column: continue
+                if v == str(query): return Cell(i + 1, j + 1, v)
+        return None
+
+    def _set(self, row, col, value):
+        while len(self.rows) < row: self.rows.append([])
+        r = self.rows[row - 1]
+        while len(r) < col: r.append("")
+        r[col - 1] = str(value)
+
+    def update_cell(self, row, col, value):
+        self._call("update_cell", write=True)
+        self._set(row, col, value)
+
+    def batch_update(self, data, **kwargs):
+        self._call("batch_update", write=True)
+        for d in data:
+            row, col = a1_to_rowcol(d["range"].split("!")[-1].split(":")[0])
+            for i, values in enumerate(d["values"]):
+                for j, v in enumerate(values): self._set(row + i, col + j, v)
+
+    def delete_rows(self, start, end=None):
+        self._call("delete_rows", write=True)
+        del self.rows[start - 1:(end or start)]
+
+    def update_title(self, title):
+        self._call("update_title", write=True)
+        self.spreadsheet.sheets[title] = self.spreadsheet.sheets.pop(self.title)
+        self.title = title
+
+
+class FakeSpreadsheet:
+    def __init__(self, tables, faults):
+        self.id, self.faults = "fake-spreadsheet", faults
+        self.version, self.modified = 1, time.time()
+        self.sheets = {}
+        for name, rows in tables.items():
+            self.sheets[name] = FakeWorksheet(self, name, rows, len(self.sheets))
+
+    def touch(self):
+        """كل كتابة ترفع نسخة الملف كما يفعل Drive"""
+        self.version += 1
+        self.modified = time.time()
+
+    def worksheet(self, title):
+        status = self.faults.hit("sheets_read", "worksheet")
+        if status: raise _api_error(status)
+        if title not in self.sheets: raise WorksheetNotFound(title)
+        return self.sheets[title]
+
+    def worksheets(self):
+        self.faults.hit("sheets_read", "worksheets")
+        return list(self.sheets.values())
+
+    def add_worksheet(self, title, rows=100, cols=20):
+        self.faults.hit("sheets_write", "add_worksheet")
+        self.touch()
+        self.sheets[title] = FakeWorksheet(self, title, [], len(self.sheets))
+        return self.sheets[title]
+
+    def values_batch_get(self, ranges, params=None):
+        status = self.faults.hit("sheets_read", "values_batch_get")
+        if status: raise _api_error(status)
+        out = []
+        for r in ranges:
+            name, _, a1 = r.rpartition("!") if "!" in r else (r, "", "")
+            name = name.strip("'").replace("''", "'")
+            if name not in self.sheets: raise _api_error(400)
+            out.append({"range": r, "values": _slice(self.sheets[name].rows, a1)})
+        return {"valueRanges": out}
+
+    def batch_update(self, body):
+        status = self.faults.hit("sheets_write", "spreadsheet_batch_update")
+        if status: raise _api_error(status)
+        self.touch()
+        by_id = {ws.id: ws for ws in self.sheets.values()}
+        for req in body["requests"]:
+            if "updateCells" in req:
+                u = req["updateCells"]
+                ws, start = by_id[u["range"]["sheetId"]], u["range"]["startRowIndex"]
+                for i, row in enumerate(u["rows"]):
+                    ws.rows[start + i] = [str(next(iter(v["userEnteredValue"].values()))) for v in row["values"]]
+            elif "deleteDimension" in req:
+                d = req["deleteDimension"]["range"]
+                del by_id[d["sheetId"]].rows[d["startIndex"]:d["endIndex"]]
+
+
+class FakeClient:
+    def __init__(self, spreadsheet):
+        self.spreadsheet = spreadsheet
+
+    def open_by_key(self, key):
+        status = self.spreadsheet.faults.hit("sheets_read", "open_by_key")
+        if status: raise _api_error(status)
+        return self.spreadsheet
+
+
+# --------------------------------------------------------------------------
+# Drive
+# --------------------------------------------------------------------------
+
+class _FakeHttp:
+    """يكفي MediaIoBaseDownload: طلب GET مع ترويسة range"""
+    def __init__(self, drive):
+        self.drive = drive
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        file_id = uri.rsplit("/", 1)[-1]
+        status = self.drive.faults.hit("drive", "download")
+        if status: return _Response(status), b"injected fault"
+        data = self.drive.files_data.get(file_id)
+        if data is None: return _Response(404), b"not found"
+        start, end = 0, len(data) - 1
+        m = re.match(r"bytes=(\d+)-(\d*)", (headers or {}).get("range", (headers or {}).get("Range", "")))
+        if m:
+            start = int(m.group(1))
+            end = min(int(m.group(2)), len(data) - 1) if m.group(2) else len(data) - 1
+        if start >= len(data): return _Response(416), b""
+        return _Response(206, {"content-range": f"bytes {start}-{end}/{len(data)}"}), data[start:end + 1]
+
+
+class _FakeRequest:
+    def __init__(self, drive, uri, execute):
+        self.drive, self.uri, self.headers, self._execute = drive, uri, {}, execute
+        self.http = _FakeHttp(drive)
+
+    def execute(self, **kwargs):
+        return self._execute(self)
+
+
+class _FakeUpload:
+    """create(): يُرفع على أجزاء عبر next_chunk كما في الرفع القابل للاستئناف"""
+    def __init__(self, drive, body, media):
+        self.drive, self.body, self.media = drive, body, media
+        self.progress, self.parts = 0, []
+
+    def next_chunk(self, **kwargs):
+        status = self.drive.faults.hit("drive", "upload_chunk")
+        if status: raise _http_error(status)
+        size, chunk = self.media.size(), self.media.chunksize()
+        data = self.media.getbytes(self.progress, chunk)
+        self.parts.append(data)
+        self.progress += len(data)
+        if self.progress < size: return MediaUploadProgress(self.progress, size), None
+        return None, self.drive._store(self.body.get("name", ""), b"".join(self.parts))
+
+    def execute(self, **kwargs):
+        response = None
+        while response is None: _, response = self.next_chunk()
+        return response
+
+
+class _FakeFiles:
+    def __init__(self, drive):
+        self.drive = drive
+
+    def create(self, body=None, media_body=None, **kwargs):
+        return _FakeUpload(self.drive, body or {}, media_body)
+
+    def get(self, fileId, fields=None, **kwargs):
+        def _execute(request):
+            status = self.drive.faults.hit("drive", "get")
+            if status: raise _http_error(status)
+            sheet = self.drive.spreadsheet
+            if sheet is not None and fileId == sheet.id:
+                modified = datetime.fromtimestamp(sheet.modified, timezone.utc).isoformat()
+                return {"id": fileId, "version": str(sheet.version), "modifiedTime": modified}
+            data = self.drive.files_data.get(fileId)
+            if data is None: raise _http_error(404)
+            return {"id": fileId, "md5Checksum": hashlib.md5(data).hexdigest(), "version": "1", "size": str(len(data))}
+        return _FakeRequest(self.drive, f"https://fake/drive/v3/files/{fileId}", _execute)
+
+    def get_media(self, fileId, **kwargs):
+        drive = self.drive
+        def _execute(request):
+            resp, content = request.http.request(request.uri, headers=request.headers)
+            if resp.status >= 400 and resp.status != 416: raise _http_error(resp.status)
+            if resp.status == 416: raise _http_error(416)
+            return content
+        return _FakeRequest(drive, f"https://fake/drive/v3/files/{fileId}", _execute)
+
+
+class FakeDrive:
+    def __init__(self, faults, files=None):
+        self.faults = faults
+        self.files_data = dict(files or {})
+        self.spreadsheet = None
+        self.lock = threading.Lock()
+
+    def _store(self, name, data):
+        with self.lock:
+            file_id = f"file{len(self.files_data) + 1}"
+            self.files_data[file_id] = data
+        return {"id": file_id, "webViewLink": f"https://fake/drive/{file_id}"}
+
+    def files(self):
+        return _FakeFiles(self)
+
+
+# --------------------------------------------------------------------------
+# التركيب
+# --------------------------------------------------------------------------
+
+class _Secrets(dict):
+    pass
+
+
+def install(tables, faults=None, files=None, cache_dir=None, secrets=None):
+    """يربط backend بالبدائل ويصفّر كل المخازن المشتركة؛ يعيد (client, drive)"""
+    faults = faults or Faults()
+    client = FakeClient(FakeSpreadsheet(tables, faults))
+    drive = FakeDrive(faults, files)
+    drive.spreadsheet = client.spreadsheet
+    conf = {"google": {"spreadsheet_id": "fake-spreadsheet", "drive_folder_id": "fake-folder"}}
+    if cache_dir:
+        conf["blob_cache"] = {"dir": os.path.join(cache_dir, "blobs")}
+    conf.update(secrets or {})
+    bk.st.secrets = _Secrets(conf)
+    bk.get_connection = lambda: client
+    bk._get_drive_service = lambda: drive
+    bk.st.cache_resource.clear()
+    if cache_dir:
+        bk.THUMBNAIL_DIR = os.path.join(cache_dir, "thumbnails")
+    return client, drive
+
+
+def sample_image(size=(1600, 1200)):
+    """صورة JPEG للاختبار (تحتاج Pillow)"""
+    from PIL import Image
+    out = io.BytesIO()
+    Image.new("RGB", size, (120, 80, 200)).save(out, format="JPEG", quality=85)
+    return out.getvalue()
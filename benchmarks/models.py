@@ -0,0 +1,83 @@
+"""قياس زمن بناء الموديلات والذاكرة المستخدمة عند 10k و 100k صف
+
+مقارنة بين الطريقة القديمة (iterrows + كائنات بقاموس) والطريقة الحالية
+(بناء عمودي + __slots__). لا يحتاج اتصالاً بقوقل.
+
+    python benchmarks/models.py [عدد_الصفوف ...]
+"""
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+import backend as bk  # noqa: E402
+
+
+class LegacyContentModel:
+    """نسخة من ContentModel قبل إضافة __slots__ للمقارنة"""
+    def __init__(self, cid, catid, title, body, link, ctype, by, at):
+        self.content_id, self.category_id, self.title = cid, catid, title
+        self.body, self.social_link, self.content_type = body, link, ctype
+        self.created_by, self.created_at = by, at
+
+
+def make_content_frame(n):
+    return pd.DataFrame({
+        'content_id': [f"c{i}" for i in range(n)],
+        'category_id': [f"cat{i % 50}" for i in range(n)],
+        'content_type': ["text"] * n,
+        'title': [f"عنوان {i}" for i in range(n)],
+        'body': ["نص المحتوى"] * n,
+        'file_url': [""] * n,
+        'social_link': [""] * n,
+        'thumbnail': [""] * n,
+        'created_by': ["admin"] * n,
+        'created_at': ["2024-01-01"] * n,
+    })
+
+
+def legacy_build(df):
+    return [LegacyContentModel(r['content_id'], r['category_id'], r['title'], r['body'], r['social_link'], r['content_type'], r['created_by'], r['created_at']) for _, r in df.iterrows()]
+
+
+def current_build(df):
+    return bk._hydrate(df, bk.ContentModel, bk.ContentModel._COLUMNS)
+
+
+def measure(build, df):
+    gc.collect()
+    start = time.perf_counter()
+    objs = build(df)
+    elapsed = time.perf_counter() - start
+    del objs
+    gc.collect()
+    tracemalloc.start()
+    objs = build(df)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    # حجم الكائن نفسه (بدون القيم المشتركة): هنا يظهر أثر __slots__
+    per_obj = sys.getsizeof(objs[0]) + (sys.getsizeof(vars(objs[0])) if hasattr(objs[0], '__dict__') else 0)
+    del objs
+    return elapsed, size, per_obj
+
+
+def main(sizes):
+    print(f"{'rows':>8} | {'method':<18} | {'time (s)':>9} | {'memory (MB)':>11} | {'bytes/obj':>9}")
+    print("-" * 68)
+    for n in sizes:
+        df = make_content_frame(n)
+        results = {}
+        for name, build in (("iterrows + dict", legacy_build), ("columns + slots", current_build)):
+            results[name] = measure(build, df)
+            t, mem, per_obj = results[name]
+            print(f"{n:>8} | {name:<18} | {t:>9.3f} | {mem / 1e6:>11.2f} | {per_obj:>9}")
+        (t0, m0, o0), (t1, m1, o1) = results.values()
+        print(f"{'':>8} | {'ratio':<18} | {t0 / t1:>8.1f}x | {m0 / m1:>10.1f}x | {o0 / o1:>8.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [10_000, 100_000])
@@ -0,0 +1,253 @@
+"""مجموعة قياس أداء backend.py على بيانات وهمية (1k / 10k / 100k صف) بدون اتصال بقوقل
+
+تستخدم البدائل في fakes.py مع تأخير وأخطاء قابلة للضبط، وتقيس:
+استعلامات الموديلات، الكتابة، فحص الصلاحيات، تحميل صفحة الأقسام، ورفع/تحميل ملفات Drive.
+النتيجة تُطبع كجدول وتُحفظ كملف JSON لمتابعة الأداء بين الإصدارات.
+
+    python benchmarks/suite.py [عدد_الصفوف ...] [--latency 50] [--rate-429 0.02] [--out report.json]
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.dirname(__file__)))
+from fakes import Faults, bk, install, sample_image  # noqa: E402
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+WORKLOADS = ("model_queries", "writes", "permissions", "page_sections", "drive")
+
+
+# --------------------------------------------------------------------------
+# البيانات
+# --------------------------------------------------------------------------
+
+def make_tables(n, seed=0):
+    """n صف للجداول الكبيرة (المحتوى، التعليقات، الصلاحيات) والباقي بنسب منها"""
+    rnd = random.Random(seed)
+    sections = [["section_id", "name", "created_by", "created_at", "sort_order", "is_public"]]
+    sections += [[f"s{i}", f"قسم {i}", "admin", "2024-01-01", str(i), "True"] for i in range(20)]
+    tabs = [["tab_id", "section_id", "name", "created_by", "created_at", "sort_order"]]
+    tabs += [[f"t{i}", f"s{i // 5}", f"تبويب {i}", "admin", "2024-01-01", str(i % 5)] for i in range(100)]
+    categories = [["category_id", "tab_id", "name", "created_by", "created_at", "sort_order"]]
+    categories += [[f"c{i}", f"t{i // 5}", f"تصنيف {i}", "admin", "2024-01-01", str(i % 5)] for i in range(500)]
+    content = [["content_id", "category_id", "content_type", "title", "body", "file_url", "social_link", "thumbnail", "created_by", "created_at"]]
+    content += [[f"x{i}", f"c{i % 500}", "text", f"عنوان {i}", "نص المحتوى " * 5, "", "", "", "admin", "2024-01-01"] for i in range(n)]
+    comments = [["comment_id", "content_id", "user_name", "comment_text", "created_at"]]
+    comments += [[f"m{i}", f"x{rnd.randrange(n)}", "user", "تعليق", f"2024-01-{1 + i % 28:02d} 10:{i % 60:02d}:00"] for i in range(n)]
+    n_users = max(10, n // 100)
+    users = [["user_id", "name", "email", "password_hash", "role_id", "status", "created_at"]]
+    users += [[f"u{i}", f"مستخدم {i}", f"user{i}@example.com", "x", str(1 + i % 4), "active", "2024-01-01"] for i in range(n_users)]
+    permissions = [["permission_id", "user_id", "section_id", "tab_id", "content_id", "view", "edit", "hidden"]]
+    # بدون تكرار (user, section, tab) حتى لا يبدأ الضغط الخلفي أثناء القياس
+    for i in range(n):
+        uid, slot = i % n_users, i // n_users
+        sid, tid = f"s{slot % 20}", (f"t{(slot % 20) * 5 + slot // 20 - 1}" if slot >= 20 else "")
+        if slot >= 120: break
+        permissions.append([f"p{i}", f"u{uid}", sid, tid, "", "TRUE", str(i % 3 == 0).upper(), "FALSE"])
+    media = [["media_id", "file_name", "file_type", "google_drive_id", "uploaded_by", "uploaded_at"]]
+    media += [[f"md{i}", f"file{i}.pdf", "application/pdf", f"d{i}", "admin", "2024-01-01"] for i in range(max(10, n // 10))]
+    checklists = [["item_id", "main_title", "sub_title", "item_name", "is_checked", "created_by"]]
+    checklists += [[f"i{i}", f"رئيسي {i % 10}", f"فرعي {i % 50}", f"بند {i}", "FALSE", "admin"] for i in range(max(10, n // 10))]
+    settings = [["setting_key", "setting_value", "updated_by", "updated_at"], ["site_title", "الموقع", "admin", "2024-01-01"]]
+    return {
+        bk.TABLE_SECTIONS: sections, bk.TABLE_TABS: tabs, bk.TABLE_CATEGORIES: categories,
+        bk.TABLE_CONTENT: content, bk.TABLE_COMMENTS: comments, bk.TABLE_USERS: users,
+        bk.TABLE_PERMISSIONS: permissions, bk.TABLE_MEDIA: media, bk.TABLE_CHECKLISTS: checklists,
+        bk.TABLE_SETTINGS: settings,
+    }
+
+
+# --------------------------------------------------------------------------
+# أدوات القياس
+# --------------------------------------------------------------------------
+
+class Recorder:
+    def __init__(self, faults, rows):
+        self.faults, self.rows, self.results = faults, rows, []
+
+    def measure(self, workload, name, fn, ops=1):
+        before = dict(self.faults.calls)
+        start = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - start
+        calls = {}
+        for key, n in self.faults.calls.items():
+            diff = n - before.get(key, 0)
+            if diff: calls[key[0]] = calls.get(key[0], 0) + diff
+        self.results.append({
+            "workload": workload, "name": name, "rows": self.rows, "ops": ops,
+            "seconds": round(elapsed, 6), "per_op_ms": round(elapsed * 1000 / max(ops, 1), 4),
+            "api_calls": calls,
+        })
+
+
+def _hierarchy():
+    count = 0
+    for sec in bk.SectionModel.get_all_sections():
+        for tab in bk.TabModel.get_tabs_by_section(sec.section_id):
+            for cat in bk.CategoryModel.get_categories_by_tab(tab.tab_id):
+                count += len(bk.ContentModel.get_content_by_category(cat.category_id))
+    return count
+
+
+# --------------------------------------------------------------------------
+# أحمال العمل
+# --------------------------------------------------------------------------
+
+def bench_model_queries(rec, n):
+    rec.measure("model_queries", "hierarchy_cold", _hierarchy)
+    rec.measure("model_queries", "hierarchy_warm", _hierarchy)
+    content_ids = [f"x{i}" for i in range(0, n, max(1, n // 100))]
+    rec.measure("model_queries", "comments_page_cold", lambda: bk.CommentModel.get_comments_page(content_ids[0]))
+    rec.measure("model_queries", "comments_page_warm", lambda: [bk.CommentModel.get_comments_page(c) for c in content_ids], len(content_ids))
+    rec.measure("model_queries", "comment_count_warm", lambda: [bk.CommentModel.get_comment_count(c) for c in content_ids], len(content_ids))
+    emails = [f"user{i}@example.com" for i in range(0, max(10, n // 100), max(1, n // 10000))][:100]
+    rec.measure("model_queries", "user_by_email", lambda: [bk.UserModel.get_user_by_email(e) for e in emails], len(emails))
+    rec.measure("model_queries", "all_media", bk.MediaModel.get_all_media)
+    rec.measure("model_queries", "all_checklist_items", bk.ChecklistModel.get_all_items)
+
+
+def bench_writes(rec, n):
+    bk.get_data(bk.TABLE_CONTENT)
+    rows = [[f"new{i}", "c0", "text", f"جديد {i}", "", "", "", "", "admin", "2024-01-01"] for i in range(100)]
+    rec.measure("writes", "add_rows_x100", lambda: bk.add_rows(bk.TABLE_CONTENT, rows), 100)
+    bk.get_data(bk.TABLE_CONTENT)
+    ids = [f"x{i}" for i in range(0, n, max(1, n // 50))][:50]
+    rec.measure("writes", "update_field", lambda: [bk.update_field(bk.TABLE_CONTENT, "content_id", i, "title", "معدل") for i in ids], len(ids))
+    bk.get_data(bk.TABLE_CONTENT)
+    updates = [(f"x{i}", "title", "دفعة") for i in range(0, n, max(1, n // 100))][:100]
+    rec.measure("writes", "update_fields_x100", lambda: bk.update_fields(bk.TABLE_CONTENT, "content_id", updates), len(updates))
+    bk.get_data(bk.TABLE_CONTENT)
+    victims = [f"new{i}" for i in range(20)]
+    rec.measure("writes", "delete_row", lambda: [bk.delete_row(bk.TABLE_CONTENT, "content_id", v) for v in victims], len(victims))
+    rec.measure("writes", "create_comment", lambda: [bk.CommentModel.create_comment("x0", "user", "تعليق جديد") for _ in range(20)], 20)
+
+
+def bench_permissions(rec, n):
+    n_users = max(10, n // 100)
+    rec.measure("permissions", "matrix_cold", lambda: bk.PermissionModel.get_user_matrix("u0"))
+    rnd = random.Random(1)
+    queries = [(f"u{rnd.randrange(n_users)}", f"s{rnd.randrange(20)}", f"t{rnd.randrange(100)}" if rnd.random() < 0.5 else None)
+               for _ in range(10_000)]
+    rec.measure("permissions", "check_access_x10k", lambda: [bk.PermissionModel.check_access(*q) for q in queries], len(queries))
+    grants = [{"sid": f"s{i}", "view": True, "edit": i % 2 == 0, "hidden": False} for i in range(20)]
+    rec.measure("permissions", "grant_permissions_x20", lambda: bk.PermissionModel.grant_permissions("u1", grants), len(grants))
+
+
+def _sections_page():
+    bk.prefetch_tables([bk.TABLE_SECTIONS, bk.TABLE_TABS, bk.TABLE_CATEGORIES, bk.TABLE_CONTENT, bk.TABLE_PERMISSIONS, bk.TABLE_COMMENTS])
+    for sec in bk.SectionModel.get_all_sections():
+        bk.PermissionModel.check_access("u1", sec.section_id)
+        for tab in bk.TabModel.get_tabs_by_section(sec.section_id):
+            bk.PermissionModel.check_access("u1", sec.section_id, tab.tab_id)
+            for cat in bk.CategoryModel.get_categories_by_tab(tab.tab_id):
+                for item in bk.ContentModel.get_content_by_category(cat.category_id)[:10]:
+                    bk.CommentModel.get_comment_count(item.content_id)
+
+
+def bench_page_sections(rec, n):
+    rec.measure("page_sections", "render_cold", _sections_page)
+    rec.measure("page_sections", "render_warm", _sections_page)
+    bk.invalidate_table(bk.TABLE_COMMENTS)
+    rec.measure("page_sections", "render_after_comment_write", _sections_page)
+
+
+def bench_drive(rec, n, files=10, size=256 * 1024):
+    payload = os.urandom(size)
+    batch = [(io.BytesIO(payload), f"file{i}.bin", "application/octet-stream") for i in range(files)]
+    results = []
+    rec.measure("drive", f"upload_files_x{files}", lambda: results.extend(bk.upload_files_to_cloud(batch)), files)
+    ids = [r[0] for r in results if r[0]]
+    rec.measure("drive", "get_file_content_cold", lambda: [bk.get_file_content(i) for i in ids], len(ids))
+    rec.measure("drive", "get_file_content_warm", lambda: [bk.get_file_content(i) for i in ids], len(ids))
+    rec.measure("drive", "get_file_range_64k", lambda: [bk.get_file_range(i, 0, 65535) for i in ids], len(ids))
+    if bk.Image is not None:
+        image = sample_image()
+        ups = bk.upload_files_to_cloud([(io.BytesIO(image), f"img{i}.jpg", "image/jpeg") for i in range(files)])
+        img_ids = [u[0] for u in ups if u[0]]
+        # المصغرات تُنشأ عند الرفع: نحذفها لقياس التحميل والإنشاء معاً
+        for i in img_ids: os.remove(bk._thumbnail_path(i))
+        rec.measure("drive", "fetch_thumbnails_parallel", lambda: list(bk.fetch_thumbnails(img_ids)), len(img_ids))
+
+
+BENCHES = {
+    "model_queries": bench_model_queries, "writes": bench_writes, "permissions": bench_permissions,
+    "page_sections": bench_page_sections, "drive": bench_drive,
+}
+
+
+# --------------------------------------------------------------------------
+# التشغيل
+# --------------------------------------------------------------------------
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(__file__),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def run(sizes, workloads, latency_ms=0.0, jitter_ms=0.0, rate_429=0.0, rate_5xx=0.0, seed=0):
+    results = []
+    for n in sizes:
+        tables = make_tables(n, seed)
+        for workload in workloads:
+            cache_dir = tempfile.mkdtemp(prefix="bench-cache-")
+            faults = Faults(latency_ms / 1000, jitter_ms / 1000, rate_429, rate_5xx, seed)
+            # نسخة جديدة من البيانات وكاش فارغ لكل حمل عمل
+            install({k: [list(r) for r in v] for k, v in tables.items()}, faults, cache_dir=cache_dir,
+                    secrets={"retry": {"base_delay": 0.05, "max_delay": 0.5}})
+            rec = Recorder(faults, n)
+            try:
+                BENCHES[workload](rec, n)
+            finally:
+                shutil.rmtree(cache_dir, ignore_errors=True)
+            results.extend(rec.results)
+            for r in rec.results:
+                calls = " ".join(f"{k}={v}" for k, v in sorted(r["api_calls"].items()))
+                print(f"{n:>7} | {r['workload']:<14} | {r['name']:<28} | {r['seconds']:>9.4f}s | {r['per_op_ms']:>10.3f} ms/op | {calls}")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("sizes", nargs="*", type=int, default=[1_000, 10_000, 100_000])
+    parser.add_argument("--only", nargs="+", choices=WORKLOADS, default=list(WORKLOADS))
+    parser.add_argument("--latency", type=float, default=0.0, help="تأخير كل طلب API (ms)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="تذبذب إضافي عشوائي (ms)")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="نسبة طلبات 429")
+    parser.add_argument("--rate-5xx", type=float, default=0.0, help="نسبة طلبات 5xx")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="مسار ملف JSON (الافتراضي benchmarks/results/)")
+    args = parser.parse_args(argv)
+
+    started = time.time()
+    results = run(args.sizes, args.only, args.latency, args.jitter, args.rate_429, args.rate_5xx, args.seed)
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {"sizes": args.sizes, "workloads": args.only, "latency_ms": args.latency, "jitter_ms": args.jitter,
+                   "rate_429": args.rate_429, "rate_5xx": args.rate_5xx, "seed": args.seed},
+        "duration_s": round(time.time() - started, 2),
+        "results": results,
+    }
+    out = args.out or os.path.join(RESULTS_DIR, f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f: json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nالتقرير: {out}")
+
+
+if __name__ == "__main__":
+    main()
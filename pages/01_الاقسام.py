@@ -27,6 +27,8 @@ except ImportError as e:
 # ==========================================
 st.set_page_config(page_title="تصفح الأقسام", page_icon="📂", layout="wide")
 bk.apply_custom_style()
+# قياس طلبات هذا التشغيل للصفحة (لوحة الأداء)
+bk.track_rerun("الأقسام")
 
 # ==========================================
 # 3. التحقق من الصلاحيات
@@ -44,12 +46,12 @@ def is_super_admin():
 def can_edit_structure():
     return user and user.role_id in [bk.ROLE_SUPER_ADMIN, bk.ROLE_ADMIN]
 
-def can_edit_content(section_id=None):
+def can_edit_content(section_id=None, tab_id=None):
     if not user: return False
     if user.role_id in [bk.ROLE_SUPER_ADMIN, bk.ROLE_ADMIN]: return True
     if user.role_id == bk.ROLE_SUPERVISOR:
         try:
-            can_view, can_edit = bk.PermissionModel.check_access(user.user_id, section_id=section_id)
+            can_view, can_edit = bk.PermissionModel.check_access(user.user_id, section_id=section_id, tab_id=tab_id)
             return can_edit
         except: return False
     return False
@@ -152,12 +154,194 @@ def smart_embed_link(link):
 
 
 # ==========================================
-# 4. واجهة المستخدم
+# 4. مكونات العرض (تُنفذ فقط للمسار المختار)
+# ==========================================
+# st.tabs تنفذ محتوى كل التبويبات في كل إعادة تشغيل، لذلك نستخدم شريط اختيار
+# يعرض القسم ← القسم الفرعي ← التصنيف المختار فقط، ونغلف الأجزاء بـ st.fragment
+# حتى لا يعاد بناء الصفحة كاملة عند التنقل أو إضافة تعليق
+
+ADD_OPTION = "__add__"
+COMMENTS_PAGE_SIZE = 10
+
+def nav_bar(label, items, key, add_label=None):
+    """شريط تنقل أفقي يرجع معرف العنصر المختار (أو ADD_OPTION)"""
+    options = [i for i, _ in items]
+    names = dict(items)
+    if add_label:
+        options.append(ADD_OPTION)
+        names[ADD_OPTION] = add_label
+    return st.radio(label, options, format_func=lambda o: names.get(o, str(o)),
+                    horizontal=True, key=key, label_visibility="collapsed")
+
+@st.fragment
+def render_content_card(item):
+    with st.container(border=True):
+        c1, c2 = st.columns([0.95, 0.05])
+        c1.markdown(f"### {item.title}")
+        if is_super_admin():
+            if c2.button("🗑", key=f"del_{item.content_id}"):
+                bk.ContentModel.delete_content(item.content_id)
+                st.rerun()
+        
+        if item.body: st.markdown(item.body, unsafe_allow_html=True)
+        if item.social_link:
+            st.divider()
+            smart_embed_link(item.social_link)
+        
+        st.caption(f"✍️ {item.created_by} | 📅 {item.created_at}")
+
+        # ==================================
+        # قسم التعليقات
+        # ==================================
+        st.divider()
+        
+        # عدد التعليقات فقط (من الفهرس)، والنصوص تُحمّل عند فتح التعليقات
+        try:
+            comments_count = bk.CommentModel.get_comment_count(item.content_id)
+        except AttributeError:
+            comments_count = 0
+            st.error("⚠️ يرجى تحديث ملف backend.py لإضافة جدول التعليقات")
+
+        if st.toggle(f"💬 التعليقات ({comments_count})", key=f"show_com_{item.content_id}"):
+            # 1. عرض التعليقات الموجودة (الأحدث أولاً، صفحة بعد صفحة)
+            pages_key = f"com_pages_{item.content_id}"
+            pages = st.session_state.get(pages_key, 1)
+            comments_list, next_cursor = [], 0
+            for _ in range(pages):
+                if next_cursor is None: break
+                page, next_cursor = bk.CommentModel.get_comments_page(item.content_id, COMMENTS_PAGE_SIZE, next_cursor)
+                comments_list += page
+
+            if comments_list:
+                for comm in comments_list:
+                    with st.chat_message("user"):
+                        st.markdown(f"**{comm['user_name']}**: {comm['comment_text']}")
+                        st.caption(f"🕒 {comm['created_at']}")
+                        # زر حذف التعليق للمشرفين
+                        if is_super_admin():
+                            if st.button("حذف", key=f"del_com_{comm['comment_id']}"):
+                                bk.CommentModel.delete_comment(comm['comment_id'])
+                                st.rerun(scope="fragment")
+                if next_cursor is not None:
+                    if st.button("⬇️ عرض المزيد", key=f"more_com_{item.content_id}"):
+                        st.session_state[pages_key] = pages + 1
+                        st.rerun(scope="fragment")
+            else:
+                st.caption("لا توجد تعليقات حتى الآن. كن أول من يعلق!")
+
+            # 2. نموذج إضافة تعليق جديد
+            st.markdown("---")
+            with st.form(key=f"comment_form_{item.content_id}", clear_on_submit=True):
+                new_comment_text = st.text_area("أضف تعليقك...", height=70)
+                submit_comment = st.form_submit_button("إرسال التعليق")
+                
+                if submit_comment:
+                    if new_comment_text.strip():
+                        try:
+                            bk.CommentModel.create_comment(item.content_id, user.name, new_comment_text)
+                            st.success("تم إرسال تعليقك!")
+                            time.sleep(0.5)
+                            st.rerun(scope="fragment")
+                        except Exception as e:
+                            st.error(f"خطأ: {e}")
+                    else:
+                        st.warning("التعليق فارغ!")
+
+def render_category(current_section, current_cat):
+    # نشر محتوى
+    if can_edit_content(current_section.section_id, current_cat.tab_id):
+        with st.expander("✍️ نشر محتوى جديد", expanded=False):
+            with st.form(f"add_content_{current_cat.category_id}"):
+                ct_title = st.text_input("عنوان الموضوع")
+                if st_quill:
+                    ct_body = st_quill(placeholder="اكتب المحتوى هنا...", key=f"q_{current_cat.category_id}")
+                else:
+                    ct_body = st.text_area("المحتوى", key=f"a_{current_cat.category_id}")
+                social_link = st.text_input("رابط (انستقرام، تيك توك...)")
+                if st.form_submit_button("نشر"):
+                    if ct_title:
+                        bk.ContentModel.create_content(current_cat.category_id, "text", ct_title, ct_body, social_link, user.name)
+                        st.success("تم النشر")
+                        time.sleep(1)
+                        st.rerun(scope="fragment")
+                    else:
+                        st.error("العنوان مطلوب")
+
+    # عرض المحتوى + التعليقات (لهذا التصنيف فقط)
+    contents = bk.ContentModel.get_content_by_category(current_cat.category_id)
+    if contents:
+        for item in contents:
+            render_content_card(item)
+    else:
+        st.info("لا يوجد محتوى هنا.")
+
+def render_tab(current_tab):
+    categories = bk.CategoryModel.get_categories_by_tab(current_tab.tab_id)
+    
+    if not categories:
+        st.caption("لا توجد تصنيفات.")
+        if can_edit_structure():
+            with st.form(f"add_cat_{current_tab.tab_id}"):
+                cn = st.text_input("اسم التصنيف الجديد")
+                if st.form_submit_button("إضافة تصنيف"):
+                    bk.CategoryModel.create_category(current_tab.tab_id, cn, user.name)
+                    st.rerun(scope="fragment")
+        return None
+
+    sel_cat = nav_bar("التصنيف", [(c.category_id, c.name) for c in categories], f"nav_cat_{current_tab.tab_id}",
+                      "➕ تصنيف" if can_edit_structure() else None)
+    if sel_cat == ADD_OPTION:
+        with st.form(f"new_cat_form_{current_tab.tab_id}"):
+            ncn = st.text_input("اسم التصنيف")
+            if st.form_submit_button("إضافة"):
+                bk.CategoryModel.create_category(current_tab.tab_id, ncn, user.name)
+                st.rerun(scope="fragment")
+        return None
+    return next((c for c in categories if c.category_id == sel_cat), None)
+
+@st.fragment
+def render_section(current_section):
+    sub_tabs_data = bk.TabModel.get_tabs_by_section(current_section.section_id)
+    
+    if not sub_tabs_data:
+        st.info("لا توجد أقسام فرعية هنا.")
+        if can_edit_structure():
+            with st.expander("➕ إضافة قسم فرعي (Tab)"):
+                with st.form(f"add_tab_{current_section.section_id}"):
+                    tn = st.text_input("اسم القسم الفرعي")
+                    if st.form_submit_button("إضافة"):
+                        bk.TabModel.create_tab(current_section.section_id, tn, user.name)
+                        st.rerun(scope="fragment")
+        return
+
+    sel_tab = nav_bar("القسم الفرعي", [(t.tab_id, t.name) for t in sub_tabs_data], f"nav_tab_{current_section.section_id}",
+                      "➕ إضافة فرعي" if can_edit_structure() else None)
+    if sel_tab == ADD_OPTION:
+        with st.form(f"new_sub_{current_section.section_id}"):
+            tnn = st.text_input("اسم القسم الفرعي")
+            if st.form_submit_button("إضافة"):
+                bk.TabModel.create_tab(current_section.section_id, tnn, user.name)
+                st.rerun(scope="fragment")
+        return
+
+    current_tab = next((t for t in sub_tabs_data if t.tab_id == sel_tab), None)
+    if current_tab is None: return
+    st.divider()
+    current_cat = render_tab(current_tab)
+    if current_cat is not None:
+        render_category(current_section, current_cat)
+
+
+# ==========================================
+# 5. واجهة المستخدم
 # ==========================================
 
 bk.render_header()
 st.title("📂 تصفح الأقسام والمحتوى")
 
+# جلب كل جداول الصفحة بطلب واحد
+bk.prefetch_tables([bk.TABLE_SECTIONS, bk.TABLE_TABS, bk.TABLE_CATEGORIES, bk.TABLE_CONTENT, bk.TABLE_COMMENTS, bk.TABLE_PERMISSIONS])
+
 sections = bk.SectionModel.get_all_sections()
 
 if not sections:
@@ -170,161 +354,20 @@ if not sections:
                     bk.SectionModel.create_section(n, user.name, True)
                     st.rerun()
 else:
-    sec_names = [s.name for s in sections]
-    if can_edit_structure(): sec_names.append("➕ إضافة قسم")
-    sec_tabs = st.tabs(sec_names)
-
-    for i, section_name in enumerate(sec_names):
-        with sec_tabs[i]:
-            if section_name == "➕ إضافة قسم":
-                st.subheader("إضافة قسم رئيسي جديد")
-                with st.form("new_sec_main"):
-                    nn = st.text_input("اسم القسم")
-                    if st.form_submit_button("إضافة"):
-                        bk.SectionModel.create_section(nn, user.name, True)
-                        st.success("تمت الإضافة")
-                        time.sleep(1)
-                        st.rerun()
-                continue 
-
-            current_section = sections[i]
-            sub_tabs_data = bk.TabModel.get_tabs_by_section(current_section.section_id)
-            
-            if not sub_tabs_data:
-                st.info("لا توجد أقسام فرعية هنا.")
-                if can_edit_structure():
-                    with st.expander("➕ إضافة قسم فرعي (Tab)"):
-                        with st.form(f"add_tab_{current_section.section_id}"):
-                            tn = st.text_input("اسم القسم الفرعي")
-                            if st.form_submit_button("إضافة"):
-                                bk.TabModel.create_tab(current_section.section_id, tn, user.name)
-                                st.rerun()
-            else:
-                sub_tab_names = [t.name for t in sub_tabs_data]
-                if can_edit_structure(): sub_tab_names.append("➕ إضافة فرعي")
-                inner_tabs = st.tabs(sub_tab_names)
-                
-                for j, sub_name in enumerate(sub_tab_names):
-                    with inner_tabs[j]:
-                        if sub_name == "➕ إضافة فرعي":
-                            with st.form(f"new_sub_{current_section.section_id}"):
-                                tnn = st.text_input("اسم القسم الفرعي")
-                                if st.form_submit_button("إضافة"):
-                                    bk.TabModel.create_tab(current_section.section_id, tnn, user.name)
-                                    st.rerun()
-                            continue
-
-                        current_tab = sub_tabs_data[j]
-                        categories = bk.CategoryModel.get_categories_by_tab(current_tab.tab_id)
-                        
-                        if not categories:
-                            st.caption("لا توجد تصنيفات.")
-                            if can_edit_structure():
-                                with st.form(f"add_cat_{current_tab.tab_id}"):
-                                    cn = st.text_input("اسم التصنيف الجديد")
-                                    if st.form_submit_button("إضافة تصنيف"):
-                                        bk.CategoryModel.create_category(current_tab.tab_id, cn, user.name)
-                                        st.rerun()
-                        else:
-                            cat_names = [c.name for c in categories]
-                            if can_edit_structure(): cat_names.append("➕ تصنيف")
-                            cat_tabs_ui = st.tabs(cat_names)
-                            
-                            for k, cat_name in enumerate(cat_names):
-                                with cat_tabs_ui[k]:
-                                    if cat_name == "➕ تصنيف":
-                                        with st.form(f"new_cat_form_{current_tab.tab_id}"):
-                                            ncn = st.text_input("اسم التصنيف")
-                                            if st.form_submit_button("إضافة"):
-                                                bk.CategoryModel.create_category(current_tab.tab_id, ncn, user.name)
-                                                st.rerun()
-                                        continue
-
-                                    current_cat = categories[k]
-                                    
-                                    # نشر محتوى
-                                    if can_edit_content(current_section.section_id):
-                                        with st.expander("✍️ نشر محتوى جديد", expanded=False):
-                                            with st.form(f"add_content_{current_cat.category_id}"):
-                                                ct_title = st.text_input("عنوان الموضوع")
-                                                if st_quill:
-                                                    ct_body = st_quill(placeholder="اكتب المحتوى هنا...", key=f"q_{current_cat.category_id}")
-                                                else:
-                                                    ct_body = st.text_area("المحتوى", key=f"a_{current_cat.category_id}")
-                                                social_link = st.text_input("رابط (انستقرام، تيك توك...)")
-                                                if st.form_submit_button("نشر"):
-                                                    if ct_title:
-                                                        bk.ContentModel.create_content(current_cat.category_id, "text", ct_title, ct_body, social_link, user.name)
-                                                        st.success("تم النشر")
-                                                        time.sleep(1)
-                                                        st.rerun()
-                                                    else:
-                                                        st.error("العنوان مطلوب")
-
-                                    # عرض المحتوى + التعليقات
-                                    contents = bk.ContentModel.get_content_by_category(current_cat.category_id)
-                                    if contents:
-                                        for item in contents:
-                                            with st.container(border=True):
-                                                c1, c2 = st.columns([0.95, 0.05])
-                                                c1.markdown(f"### {item.title}")
-                                                if is_super_admin():
-                                                    if c2.button("🗑", key=f"del_{item.content_id}"):
-                                                        bk.ContentModel.delete_content(item.content_id)
-                                                        st.rerun()
-                                                
-                                                if item.body: st.markdown(item.body, unsafe_allow_html=True)
-                                                if item.social_link:
-                                                    st.divider()
-                                                    smart_embed_link(item.social_link)
-                                                
-                                                st.caption(f"✍️ {item.created_by} | 📅 {item.created_at}")
-
-                                                # ==================================
-                                                # قسم التعليقات (الجديد)
-                                                # ==================================
-                                                st.divider()
-                                                
-                                                # جلب التعليقات لهذا المحتوى
-                                                try:
-                                                    comments_list = bk.CommentModel.get_comments_by_content(item.content_id)
-                                                except AttributeError:
-                                                    comments_list = []
-                                                    st.error("⚠️ يرجى تحديث ملف backend.py لإضافة جدول التعليقات")
-
-                                                # زر توسيع التعليقات
-                                                with st.expander(f"💬 التعليقات ({len(comments_list)})"):
-                                                    # 1. عرض التعليقات الموجودة
-                                                    if comments_list:
-                                                        for comm in comments_list:
-                                                            with st.chat_message("user"):
-                                                                st.markdown(f"**{comm['user_name']}**: {comm['comment_text']}")
-                                                                st.caption(f"🕒 {comm['created_at']}")
-                                                                # زر حذف التعليق للمشرفين
-                                                                if is_super_admin():
-                                                                    if st.button("حذف", key=f"del_com_{comm['comment_id']}"):
-                                                                        bk.CommentModel.delete_comment(comm['comment_id'])
-                                                                        st.rerun()
-                                                    else:
-                                                        st.caption("لا توجد تعليقات حتى الآن. كن أول من يعلق!")
-
-                                                    # 2. نموذج إضافة تعليق جديد
-                                                    st.markdown("---")
-                                                    with st.form(key=f"comment_form_{item.content_id}", clear_on_submit=True):
-                                                        new_comment_text = st.text_area("أضف تعليقك...", height=70)
-                                                        submit_comment = st.form_submit_button("إرسال التعليق")
-                                                        
-                                                        if submit_comment:
-                                                            if new_comment_text.strip():
-                                                                try:
-                                                                    bk.CommentModel.create_comment(item.content_id, user.name, new_comment_text)
-                                                                    st.success("تم إرسال تعليقك!")
-                                                                    time.sleep(0.5)
-                                                                    st.rerun()
-                                                                except Exception as e:
-                                                                    st.error(f"خطأ: {e}")
-                                                            else:
-                                                                st.warning("التعليق فارغ!")
-
-                                    else:
-                                        st.info("لا يوجد محتوى هنا.")
+    sel_sec = nav_bar("القسم", [(s.section_id, s.name) for s in sections], "nav_section",
+                      "➕ إضافة قسم" if can_edit_structure() else None)
+
+    if sel_sec == ADD_OPTION:
+        st.subheader("إضافة قسم رئيسي جديد")
+        with st.form("new_sec_main"):
+            nn = st.text_input("اسم القسم")
+            if st.form_submit_button("إضافة"):
+                bk.SectionModel.create_section(nn, user.name, True)
+                st.success("تمت الإضافة")
+                time.sleep(1)
+                st.rerun()
+    else:
+        current_section = next((s for s in sections if s.section_id == sel_sec), None)
+        if current_section is not None:
+            st.divider()
+            render_section(current_section)
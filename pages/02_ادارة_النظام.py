@@ -1,6 +1,7 @@
 import streamlit as st
 import pandas as pd
 import time
+from datetime import datetime
 import sys
 import os
 
@@ -23,6 +24,8 @@ st.set_page_config(page_title="إدارة النظام", page_icon="⚙️", lay
 
 # تطبيق التنسيق العام
 bk.apply_custom_style()
+# قياس طلبات هذا التشغيل للصفحة (لوحة الأداء)
+bk.track_rerun("ادارة النظام")
 
 # التحقق من المستخدم
 user = bk.get_current_user()
@@ -44,10 +47,13 @@ bk.render_header()
 
 st.title("🛠️ لوحة التحكم وإدارة النظام")
 
+# جلب كل جداول الصفحة بطلب واحد
+bk.prefetch_tables([bk.TABLE_USERS, bk.TABLE_PERMISSIONS, bk.TABLE_SECTIONS, bk.TABLE_TABS, bk.TABLE_SETTINGS])
+
 # ==========================================
 # 3. واجهة التحكم (Tabs)
 # ==========================================
-main_tabs = st.tabs(["👥 المستخدمين", "🔐 الصلاحيات", "⚙️ الإعدادات"])
+main_tabs = st.tabs(["👥 المستخدمين", "🔐 الصلاحيات", "⚙️ الإعدادات", "📊 الأداء"])
 
 # ==================================================
 # TAB 1: إدارة المستخدمين
@@ -145,12 +151,11 @@ with main_tabs[1]:
         
         st.info(f"جاري تعديل صلاحيات: **{p_user.name}**")
         
-        curr_perms = bk.PermissionModel.get_permissions_by_user(p_user.user_id)
+        # مصفوفة الصلاحيات المجمعة: البحث بالمفتاح مباشرة بدلاً من المرور على كل الصفوف
+        curr_perms = bk.PermissionModel.get_user_matrix(p_user.user_id)
         
         def find_p(sid, tid=""):
-            for p in curr_perms:
-                if str(p.section_id) == str(sid) and str(p.tab_id) == str(tid): return p
-            return None
+            return curr_perms.get((str(sid), str(tid)))
             
         all_secs = bk.SectionModel.get_all_sections()
         
@@ -185,24 +190,45 @@ with main_tabs[1]:
                     st.divider()
             
                 if st.form_submit_button("💾 حفظ وتحديث الصلاحيات"):
+                    # تجميع كل الصلاحيات وإرسالها بطلب واحد بدلاً من طلب لكل قسم وتبويب
+                    grants = []
                     for sec in all_secs:
                         # قراءة القيم مباشرة من st.session_state باستخدام المفاتيح
-                        bk.PermissionModel.grant_permission(
-                            p_user.user_id, sid=sec.section_id, 
+                        grants.append(dict(
+                            sid=sec.section_id,
                             view=st.session_state.get(f"k_sv_{sec.section_id}", False), 
                             edit=st.session_state.get(f"k_se_{sec.section_id}", False), 
                             hidden=st.session_state.get(f"k_sh_{sec.section_id}", False)
-                        )
+                        ))
                         for tab in bk.TabModel.get_tabs_by_section(sec.section_id):
-                            bk.PermissionModel.grant_permission(
-                                p_user.user_id, sid=sec.section_id, tid=tab.tab_id,
+                            grants.append(dict(
+                                sid=sec.section_id, tid=tab.tab_id,
                                 view=st.session_state.get(f"k_tv_{tab.tab_id}", False), 
                                 edit=st.session_state.get(f"k_te_{tab.tab_id}", False), 
                                 hidden=st.session_state.get(f"k_th_{tab.tab_id}", False)
-                            )
-                    st.success("✅ تم تحديث الصلاحيات بنجاح!")
-                    time.sleep(1)
-                    st.rerun()
+                            ))
+                    if not bk.PermissionModel.grant_permissions(p_user.user_id, grants):
+                        st.error("فشل حفظ الصلاحيات")
+                    else:
+                        st.success("✅ تم تحديث الصلاحيات بنجاح!")
+                        time.sleep(1)
+                        st.rerun()
+
+    # صيانة جدول الصلاحيات: دمج الصفوف المكررة من عمليات الحفظ السابقة
+    with st.expander("🧹 صيانة جدول الصلاحيات"):
+        p_stats = bk.PermissionModel.get_table_stats()
+        m1, m2, m3 = st.columns(3)
+        m1.metric("عدد الصفوف", p_stats["rows"])
+        m2.metric("الصلاحيات الفعلية", p_stats["unique"])
+        m3.metric("المكرر", p_stats["duplicates"])
+        if st.button("ضغط الجدول", key="btn_compact_perms", disabled=p_stats["duplicates"] == 0):
+            removed = bk.PermissionModel.compact()
+            if removed is None:
+                st.error("فشل ضغط الجدول")
+            else:
+                st.success(f"تم حذف {removed} صف مكرر")
+                time.sleep(1)
+                st.rerun()
 
 # ==================================================
 # TAB 3: الإعدادات
@@ -227,10 +253,71 @@ with main_tabs[2]:
         
         st.write("")
         if st.form_submit_button("حفظ الإعدادات"):
-            bk.SettingModel.update_setting("site_title", tit, current_user_name)
-            bk.SettingModel.update_setting("announcement_bar", ann, current_user_name)
-            bk.SettingModel.update_setting("system_status", sta, current_user_name)
-            bk.SettingModel.update_setting("allow_guest_view", str(gst), current_user_name)
-            st.success("تم التحديث")
-            time.sleep(1)
-            st.rerun()
+            saved = bk.SettingModel.update_settings({
+                "site_title": tit,
+                "announcement_bar": ann,
+                "system_status": sta,
+                "allow_guest_view": str(gst),
+            }, current_user_name)
+            if not saved:
+                st.error("فشل حفظ الإعدادات")
+            else:
+                st.success("تم التحديث")
+                time.sleep(1)
+                st.rerun()
+
+# ==================================================
+# TAB 4: الأداء (قياسات الطلبات والكاش)
+# ==================================================
+with main_tabs[3]:
+    st.header("أداء النظام")
+    metrics = bk.get_metrics()
+    counters = {(c["counter"], c["label"]): c["value"] for c in metrics["counters"]}
+    api_ops = [o for o in metrics["operations"] if o["type"] == "api"]
+    cache_stats = bk.get_cache_stats()
+
+    k1, k2, k3, k4, k5 = st.columns(5)
+    k1.metric("طلبات API", sum(o["count"] for o in api_ops))
+    k2.metric("البيانات المنقولة", f"{sum(o['bytes'] for o in api_ops) / 1048576:.1f} MB")
+    k3.metric("إعادة المحاولة", sum(v for (c, _), v in counters.items() if c == "retries"))
+    k4.metric("أخطاء 429", sum(v for (c, _), v in counters.items() if c == "429"))
+    k5.metric("إصابات الكاش", sum(r["hits"] for r in cache_stats))
+    st.caption(f"منذ {datetime.fromtimestamp(metrics['since']).strftime('%Y-%m-%d %H:%M:%S')} — "
+               f"حالة Sheets: {bk.get_circuit_state('sheets')} | Drive: {bk.get_circuit_state('drive')}")
+
+    b1, b2 = st.columns([1, 5])
+    if b1.button("🔄 تحديث", key="btn_metrics_refresh"): st.rerun()
+    if b2.button("🗑️ تصفير القياسات", key="btn_metrics_reset"):
+        bk.reset_metrics()
+        st.rerun()
+
+    ops = pd.DataFrame(metrics["operations"])
+    if ops.empty:
+        st.caption("لا توجد قياسات بعد.")
+    else:
+        # الأكثر استهلاكاً للوقت أولاً
+        st.subheader("🐢 الأعلى تكلفة (إجمالي الوقت)")
+        st.dataframe(ops.sort_values("total_s", ascending=False).head(10), use_container_width=True, hide_index=True)
+        st.subheader("⏱️ زمن العمليات (مئينات بالمللي ثانية)")
+        st.dataframe(ops.sort_values(["type", "name", "label"]), use_container_width=True, hide_index=True)
+
+    if metrics["reruns"]:
+        st.subheader("🔁 الطلبات لكل تشغيل صفحة")
+        reruns = pd.DataFrame(metrics["reruns"])
+        st.dataframe(reruns.groupby("page").agg(runs=("calls", "size"), avg_calls=("calls", "mean"), max_calls=("calls", "max"),
+                                                avg_backend_ms=("backend_ms", "mean")).round(1), use_container_width=True)
+        st.dataframe(reruns.iloc[::-1].head(20), use_container_width=True, hide_index=True)
+
+    if metrics["counters"]:
+        st.subheader("🔢 العدادات")
+        st.dataframe(pd.DataFrame(metrics["counters"]), use_container_width=True, hide_index=True)
+
+    # إحصائيات كاش الجداول (عدد الطلبات التي تم توفيرها)
+    with st.expander("📈 أداء الكاش"):
+        if cache_stats:
+            st.dataframe(pd.DataFrame(cache_stats), use_container_width=True)
+            st.caption(f"طلبات API تم توفيرها: {sum(r['hits'] for r in cache_stats)}")
+        else:
+            st.caption("لا توجد بيانات بعد.")
+        st.markdown("**حدود معدل الطلبات (توكنات متاحة / انتظار)**")
+        st.dataframe(pd.DataFrame(bk.get_rate_limit_stats()), use_container_width=True, hide_index=True)
@@ -30,6 +30,9 @@ except ImportError as e:
 if hasattr(bk, 'apply_custom_style'):
     bk.apply_custom_style()
 
+# قياس طلبات هذا التشغيل للصفحة (لوحة الأداء)
+bk.track_rerun("المهام")
+
 # التحقق من المستخدم (مرة واحدة للكل)
 if hasattr(bk, 'get_current_user'):
     user = bk.get_current_user()
@@ -73,7 +76,7 @@ def get_analytics_data():
     # 1. بيانات المستخدمين
     try:
         users = UserModel.get_all_users()
-        df_users = pd.DataFrame([vars(u) for u in users])
+        df_users = pd.DataFrame([u.to_dict() for u in users])
     except Exception as e:
         st.error(f"خطأ في جلب المستخدمين: {e}")
         df_users = pd.DataFrame()
@@ -87,7 +90,7 @@ def get_analytics_data():
     # 3. بيانات القوائم
     try:
         checklists = ChecklistModel.get_all_items()
-        df_checklists = pd.DataFrame([vars(i) for i in checklists])
+        df_checklists = pd.DataFrame([i.to_dict() for i in checklists])
     except Exception:
         df_checklists = pd.DataFrame()
 
@@ -97,6 +100,24 @@ def get_analytics_data():
 # 3. دوال الصفحات (Logics)
 # ==========================================
 
+@st.dialog("🖼️ عرض الملف", width="large")
+def show_media(item):
+    # الملف يُحمّل من Drive مرة واحدة إلى كاش القرص. العرض والتحميل هنا يقرآن الملف كاملاً
+    # في ذاكرة Streamlit (لا يدعم طلبات Range)، أما الذاكرة المحدودة فهي داخل الـ backend فقط
+    with st.spinner("جارٍ تحميل الملف..."):
+        path = bk.get_file_path(item.google_drive_id)
+    if not path:
+        st.error("تعذر تحميل الملف")
+        return
+    file_type = (item.file_type or "").lower()
+    if "image" in file_type: st.image(path, caption=item.file_name, use_container_width=True)
+    elif "video" in file_type: st.video(path)
+    def read_file():
+        with open(path, "rb") as f: return f.read()
+    # لا يُقرأ الملف إلا عند ضغط زر التحميل
+    st.download_button("📥 تحميل", data=read_file, file_name=item.file_name,
+                       mime=item.file_type or None, use_container_width=True)
+
 def render_media_page():
     # التحقق من الصلاحيات لهذه الصفحة
     ALLOWED_ROLES = [ROLE_SUPER_ADMIN, ROLE_ADMIN, ROLE_SUPERVISOR]
@@ -105,7 +126,9 @@ def render_media_page():
         return
 
     def clear_media_cache():
-        st.cache_data.clear()
+        # مسح كاش الوسائط فقط بدلاً من كل الكاش
+        get_cached_media.clear()
+        bk.invalidate_table(bk.TABLE_MEDIA)
 
     st.header("📂 مكتبة الوسائط والملفات")
     st.markdown("---")
@@ -129,29 +152,27 @@ def render_media_page():
         else:
             cols_count = 4
             cols = st.columns(cols_count)
+            # نرسم البطاقات أولاً بأماكن فارغة، ثم نملؤها بالصور المصغرة فور وصولها
+            placeholders = {}
             for index, item in enumerate(all_media):
                 with cols[index % cols_count]:
                     with st.container(border=True):
                         is_image = "image" in item.file_type.lower()
-                        file_shown = False
                         if is_image and item.google_drive_id:
-                            if hasattr(bk, 'get_file_content'):
-                                try:
-                                    with st.spinner("."):
-                                        image_data = bk.get_file_content(item.google_drive_id)
-                                    if image_data:
-                                        st.image(image_data, use_container_width=True)
-                                        file_shown = True
-                                except Exception:
-                                    pass
-                        
-                        if not file_shown:
+                            slot = st.empty()
+                            slot.caption("⏳ جارٍ التحميل...")
+                            placeholders.setdefault(item.google_drive_id, []).append(slot)
+                            if st.button("🔍 الحجم الكامل", key=f"full_{item.media_id}", use_container_width=True):
+                                show_media(item)
+                        else:
                             icon = "📄"
                             if "video" in item.file_type: icon = "🎥"
                             elif "pdf" in item.file_type: icon = "📕"
                             elif "sheet" in item.file_type or "excel" in item.file_type: icon = "📊"
                             elif is_image: icon = "🖼️"
                             st.markdown(f"<div style='text-align: center; font-size: 50px; margin-bottom: 10px;'>{icon}</div>", unsafe_allow_html=True)
+                            if item.google_drive_id and st.button("▶️ عرض / تحميل" if icon == "🎥" else "📥 تحميل", key=f"open_{item.media_id}", use_container_width=True):
+                                show_media(item)
 
                         st.markdown(f"**{item.file_name}**")
                         st.caption(f"👤 {item.uploaded_by}")
@@ -163,55 +184,61 @@ def render_media_page():
                         else:
                             st.caption("الرابط غير متوفر")
 
+            for drive_id, thumb_data in bk.fetch_thumbnails(list(placeholders)):
+                for slot in placeholders[drive_id]:
+                    if thumb_data: slot.image(thumb_data, use_container_width=True)
+                    else: slot.markdown("<div style='text-align: center; font-size: 50px; margin-bottom: 10px;'>🖼️</div>", unsafe_allow_html=True)
+
     # التبويب الثاني: الرفع
     with tabs[1]:
         st.subheader("رفع ملفات إلى Google Drive")
         with st.container(border=True):
-            uploaded_file = st.file_uploader(
-                "اختر ملفاً للرفع (صور، فيديو، مستندات)", 
+            uploaded_files = st.file_uploader(
+                "اختر ملفاً أو أكثر للرفع (صور، فيديو، مستندات)", 
                 type=['png', 'jpg', 'jpeg', 'pdf', 'mp4', 'docx', 'xlsx'],
-                accept_multiple_files=False
+                accept_multiple_files=True
             )
 
-            if uploaded_file is not None:
-                file_details = {
-                    "اسم الملف": uploaded_file.name,
-                    "النوع": uploaded_file.type,
-                    "الحجم": f"{uploaded_file.size / 1024:.2f} KB"
-                }
-                st.json(file_details)
+            if uploaded_files:
+                st.dataframe(pd.DataFrame([{
+                    "اسم الملف": f.name,
+                    "النوع": f.type,
+                    "الحجم": f"{f.size / 1024:.2f} KB"
+                } for f in uploaded_files]), hide_index=True, use_container_width=True)
                 
-                if st.button("🚀 بدء الرفع", use_container_width=True):
-                    with st.status("جارٍ معالجة الملف...", expanded=True) as status:
-                        st.write("1️⃣ الاتصال بـ Google Drive...")
-                        drive_file_id, web_view_link = bk.upload_file_to_cloud(
-                            uploaded_file, 
-                            uploaded_file.name, 
-                            uploaded_file.type
+                if st.button(f"🚀 بدء رفع {len(uploaded_files)} ملف", use_container_width=True):
+                    with st.status("جارٍ رفع الملفات...", expanded=True) as status:
+                        # شريط تقدم لكل ملف، والملفات تُرفع بالتوازي
+                        bars = [st.progress(0.0, text=f.name) for f in uploaded_files]
+                        results = bk.upload_files_to_cloud(
+                            [(f, f.name, f.type) for f in uploaded_files],
+                            on_progress=lambda i, p: bars[i].progress(p, text=f"{uploaded_files[i].name} ({int(p * 100)}%)")
                         )
-                        
-                        if drive_file_id:
-                            st.write("2️⃣ حفظ البيانات في النظام...")
-                            MediaModel.add_media(
-                                name=uploaded_file.name,
-                                mtype=uploaded_file.type,
-                                drive_id=drive_file_id,
-                                by=user.name
-                            )
-                            status.update(label="✅ تم الرفع بنجاح!", state="complete", expanded=False)
-                            st.success(f"تم رفع الملف: {uploaded_file.name}")
+
+                        uploaded = [(f.name, f.type, did) for f, (did, _, _) in zip(uploaded_files, results) if did]
+                        failed = [(f.name, err) for f, (did, _, err) in zip(uploaded_files, results) if not did]
+                        if uploaded:
+                            st.write("💾 حفظ البيانات في النظام...")
+                            MediaModel.add_media_batch(uploaded, by=user.name)
                             clear_media_cache()
+                        for name, err in failed:
+                            st.error(f"{name}: {err}")
+
+                        if not failed:
+                            status.update(label=f"✅ تم رفع {len(uploaded)} ملف بنجاح!", state="complete", expanded=False)
                             time.sleep(1)
                             st.rerun()
                         else:
-                            status.update(label="❌ فشل الرفع!", state="error")
+                            status.update(label=f"⚠️ تم رفع {len(uploaded)} وفشل {len(failed)}", state="error")
 
 
 def render_forms_page():
     is_admin = (user.role_id in [ROLE_SUPER_ADMIN, ROLE_ADMIN])
 
     def clear_checklist_cache():
-        st.cache_data.clear()
+        # مسح كاش القوائم فقط بدلاً من كل الكاش
+        get_cached_checklists.clear()
+        get_analytics_data.clear()
 
     def toggle_item_status(item_id, current_status):
         ChecklistModel.toggle_status(item_id, current_status)
@@ -388,7 +415,9 @@ def render_reports_page():
     st.markdown("---")
     
     if st.button("🔄 تحديث البيانات الآن"):
-        st.cache_data.clear()
+        get_analytics_data.clear()
+        for table in (bk.TABLE_USERS, TABLE_CONTENT, bk.TABLE_CHECKLISTS):
+            bk.invalidate_table(table)
         st.rerun()
 
     df_users, df_content, df_checklists = get_analytics_data()
@@ -403,7 +432,7 @@ def render_reports_page():
     with col3: st.metric("📝 إجمالي المقالات", len(df_content))
     with col4:
         if not df_checklists.empty and 'is_checked' in df_checklists.columns:
-            completed_tasks = len(df_checklists[df_checklists['is_checked'].astype(str).str.upper() == 'TRUE'])
+            completed_tasks = int(df_checklists['is_checked'].sum())
             total_tasks = len(df_checklists)
             percent = int((completed_tasks / total_tasks) * 100) if total_tasks > 0 else 0
         else: percent = 0
@@ -443,7 +472,7 @@ def render_reports_page():
     with r_tabs[2]:
         st.subheader("تقدم العمل")
         if not df_checklists.empty and 'is_checked' in df_checklists.columns:
-            df_checklists['status_bool'] = df_checklists['is_checked'].astype(str).str.upper() == 'TRUE'
+            df_checklists['status_bool'] = df_checklists['is_checked']
             status_counts = df_checklists['status_bool'].value_counts().reset_index()
             status_counts.columns = ['الحالة', 'العدد']
             status_counts['الحالة'] = status_counts['الحالة'].map({True: 'منجز ✅', False: 'قيد الانتظار ⏳'})
@@ -462,6 +491,9 @@ def render_reports_page():
 # 4. التنفيذ الرئيسي (Main Interface)
 # ==========================================
 
+# جلب كل جداول الصفحة بطلب واحد
+bk.prefetch_tables([bk.TABLE_CHECKLISTS, bk.TABLE_MEDIA, bk.TABLE_USERS, TABLE_CONTENT])
+
 # [تعديل] ترتيب التبويبات: النماذج أولاً، ثم الوسائط، ثم التقارير
 main_tabs = st.tabs(["☑️ النماذج والقوائم", "🖼️ مكتبة الوسائط", "📊 التقارير والإحصائيات"])
 